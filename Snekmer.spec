@@ -48,6 +48,10 @@ module Snekmer {
     k - kmer length for features
     alphabet - mapping function for reduced amino acid sequences
     output_genome_name - output object name
+    processes - optional, number of cores for snekmer search; defaults to the
+        cores available to the container
+    families - optional, the model families to search against; defaults to
+        every bundled family
     */
     typedef string obj_ref;
 
@@ -57,6 +61,8 @@ module Snekmer {
         int k;
         int alphabet;
         string output_genome_name;
+        int processes;
+        list<string> families;
     } SnekmerSearchParams;
 
     /*
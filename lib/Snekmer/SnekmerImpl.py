@@ -1,27 +1,33 @@
 # -*- coding: utf-8 -*-
 #BEGIN_HEADER
+import json
 import logging
 import os
 import yaml
-import shutil
-import subprocess
 import zipfile
 import sys
+import tempfile
 import uuid
 from pprint import pformat
-from pprint import pprint
 from Bio import SeqIO
 from datetime import datetime
-from pathlib import Path
-import pandas as pd
 
 from installed_clients.KBaseReportClient import KBaseReport
 from installed_clients.kb_uploadmethodsClient import kb_uploadmethods
 from installed_clients.DataFileUtilClient import DataFileUtil
 from installed_clients.GenomeFileUtilClient import GenomeFileUtil
 from installed_clients.WorkspaceClient import Workspace as workspaceService
-from installed_clients.KBaseDataObjectToFileUtilsClient import KBaseDataObjectToFileUtils
 from installed_clients.GenomeAnnotationAPIClient import GenomeAnnotationAPI
+from Snekmer.Utils.annotation import hits_for_genome, AnnotationCounter
+from Snekmer.Utils.command import run_command, available_cores, peak_memory_mb
+from Snekmer.Utils.fasta import write_protein_fasta, format_genome_name, fasta_file_name
+from Snekmer.Utils.genome_cache import GenomeCache, DEFAULT_CACHE_MAX_MB
+from Snekmer.Utils.genome_fetch import (fetch_genome_projections, GENOME_READ_PATHS,
+                                        DEFAULT_FETCH_WORKERS)
+from Snekmer.Utils.genome_save import save_annotated_genomes, DEFAULT_SAVE_WORKERS
+from Snekmer.Utils.genome_spool import GenomeSpool
+from Snekmer.Utils.model_staging import stage_model_output, MODEL_OUTPUT_DIR
+from Snekmer.Utils.search_results import aggregate_search_results
 
 #END_HEADER
 
@@ -56,12 +62,21 @@ class Snekmer:
         self.shared_folder = config['scratch']
         self.workspaceURL = config['workspace-url']
         self.dfu = DataFileUtil(self.callback_url)
-        self.DOTFU = KBaseDataObjectToFileUtils(self.callback_url)
         self.wsClient = workspaceService(self.workspaceURL)
         self.genome_api = GenomeAnnotationAPI(self.callback_url)
         self.gfu = GenomeFileUtil(self.callback_url)
+        self.fetch_workers = int(config.get('genome-fetch-workers', DEFAULT_FETCH_WORKERS))
+        self.save_workers = int(config.get('genome-save-workers', DEFAULT_SAVE_WORKERS))
+        # point genome-cache-dir outside scratch to keep genomes between jobs
+        self.genome_cache_dir = config.get('genome-cache-dir',
+                                           os.path.join(self.shared_folder, 'genome_cache'))
+        self.genome_cache_max_mb = float(config.get('genome-cache-max-mb',
+                                                    DEFAULT_CACHE_MAX_MB))
+        # use model-output-dir = /kb/module/data/small_test_model_output for faster testing
+        self.model_output_dir = config.get('model-output-dir', MODEL_OUTPUT_DIR)
+        self.model_output_mode = config.get('model-output-mode', 'shared')
         logging.basicConfig(format='%(created)s %(levelname)s: %(message)s',
-                            level=logging.INFO)
+                            level=config.get('log-level', 'INFO').upper())
         #END_CONSTRUCTOR
         pass
 
@@ -127,7 +142,8 @@ class Snekmer:
         :param params: instance of type "SnekmerSearchParams" -> structure:
            parameter "workspace_name" of String, parameter "object_ref" of
            String, parameter "k" of Long, parameter "alphabet" of Long,
-           parameter "output_genome_name" of String
+           parameter "output_genome_name" of String, parameter "processes"
+           of Long, parameter "families" of list of String
         :returns: instance of type "SnekmerSearchOutput" (Output parameters
            for Snekmer Search. report_name - the name of the
            KBaseReport.Report workspace object. report_ref - the workspace
@@ -161,6 +177,13 @@ class Snekmer:
         if 'output_genome_name' not in params:
             raise ValueError('Parameter output_genome_name is not set in input arguments')
         output_genome_name = params['output_genome_name']
+        # processes is optional and defaults to every core this container may use
+        processes = int(params.get('processes') or available_cores())
+        if processes < 1:
+            raise ValueError('Parameter processes must be at least 1')
+        # families is optional and defaults to every family in model_output;
+        # the narrative sends [""] when none are chosen
+        families = [f for f in params.get('families') or [] if f] or None
 
         logging.info("Grabbing the Genome data from the input GenomeSet.")
         # accessing different parts of dfu.get_objects output
@@ -176,113 +199,66 @@ class Snekmer:
         for i in dfu_keys:
             refs.append(dfu_elements[i]['ref'])
 
-        # grab the current genome_data
-        genome_data = []
-        for i in refs:
-            print('made it into the loop for ', i)
-            genome_data.append(self.genome_api.get_genome_v1({"genomes": [{"ref": i}],
-                                                              'downgrade': 0})["genomes"][0])
+        # each call works in its own directory under scratch, so concurrent
+        # searches served by the same process never share input or output files
+        work_dir = tempfile.mkdtemp(dir=self.shared_folder)
+        logging.info('Working in ' + work_dir)
+        os.makedirs(f"{work_dir}/input")
+
+        # grab the current genome data, keeping the order of refs, and write each
+        # genome's protein FASTA to the input folder as <id>.<formatted name>.faa
+        # while the remaining genomes download; each genome is then spooled to disk
+        # and released, keeping only its id and name in memory
+        genome_spool = GenomeSpool(f"{work_dir}/genome_spool")
+
+        def export_fasta(index, genome):
+            write_protein_fasta(genome['data'], format_genome_name(genome['data']),
+                                f"{work_dir}/input")
+            return genome_spool.put(index, genome)
+
+        # only the fields used before saving are fetched here, and versioned refs
+        # fetched by earlier runs are read from the genome cache
+        genome_cache = GenomeCache(self.genome_cache_dir, self.genome_cache_max_mb,
+                                   key_salt=json.dumps(GENOME_READ_PATHS))
+        genome_summaries = fetch_genome_projections(self.wsClient, refs, self.fetch_workers,
+                                                    export_fasta, genome_cache)
+        logging.info('Genome cache: ' + genome_cache.summary())
 
         # use the formatted genome names for the organism names
         genome_names_formatted = []
         genome_names = []
-        for i in genome_data:
-            stringName = i['data']['scientific_name']
-            obj_name = "_".join(stringName.split())
-            obj_name2 = obj_name.replace("'", "_")
-            genome_names_formatted.append(obj_name2)
-            genome_names.append(stringName)
+        for i in genome_summaries:
+            genome_names_formatted.append(format_genome_name(i))
+            genome_names.append(i['scientific_name'])
 
         print("genome_names: ", genome_names)
         print("genome_names_formatted: ", genome_names_formatted)
 
-        # snekmer
-        # get GenomeSet name to add into protein fasta file names
-        data_obj = obj_dfu_get_obj['data'][0]
-        info = data_obj['info']
-        obj_name = str(info[1])
-        print('data_obj data for the GenomeSet:', data_obj)
-
-        GenomeSetToFASTA_params = {
-            'genomeSet_ref': object_ref,
-            'file': obj_name,
-            'residue_type': 'protein',
-            'feature_type': 'CDS',
-            'record_id_pattern': '%%feature_id%%',
-            'merge_fasta_files': 'FALSE'
-        }
-        print("GenomeSetToFasta params: ")
-        pprint(GenomeSetToFASTA_params)
-
-        print("Calling GenomeSetToFasta: ")
-        GenomeSetToFASTA_retVal = self.DOTFU.GenomeSetToFASTA(GenomeSetToFASTA_params)
-        fasta_file_path = GenomeSetToFASTA_retVal['fasta_file_path_list']
-        print("=" * 80)
-        print("Fasta file path: ")
-        print(fasta_file_path)
-
         # set up snekmer directory
         # Add params from the UI to the config.yaml
         logging.info('Writing UI inputs into the config.yaml')
         new_params = {'k': k, 'alphabet': alphabet}
+        # point the model/basis/score dirs at the staged model_output
+        new_params.update(stage_model_output(self.model_output_dir,
+                                             f"{work_dir}/model_output",
+                                             self.model_output_mode, families))
         with open('/kb/module/data/config.yaml', 'r') as file:
             my_config = yaml.safe_load(file)
             my_config.update(new_params)
 
-        # save updated config.yaml to self.shared_folder
-        with open(f"{self.shared_folder}/config.yaml", 'w') as file:
+        # save updated config.yaml to work_dir
+        with open(f"{work_dir}/config.yaml", 'w') as file:
             yaml.safe_dump(my_config, file)
-        os.makedirs(f"{self.shared_folder}/input")
 
-        # save model_outputs from data to /kb/module/work/tmp
-        shutil.copytree("/kb/module/data/model_output", f"{self.shared_folder}/model_output")
-        # faster testing
-        #shutil.copytree("/kb/module/data/small_test_model_output", f"{self.shared_folder}/small_test_model_output")
-        print("=" * 80)
-        print("Next copy protein fastas from /kb/module/work/tmp to /kb/module/work/tmp/input")
-
-        # save each protein FASTA to the input folder
-        for i in range(len(fasta_file_path)):
-            shutil.copy(fasta_file_path[i], f"{self.shared_folder}/input")
-        print("=" * 80)
-        print("Copied protein fastas to the input folder for the subprocess step")
-
-        # now that the protein files are in /input
-        # remove .params, replace with formatted sci name, and then add .faa extension
-        mypath = Path(f"{self.shared_folder}/input")
-        for file, i in zip(os.listdir(mypath), genome_names_formatted):
-            print("Filename in beginning of loop: ", file)
-            new_file = file.split('.', 1)[0]
-            print("Filename when everything after first period is removed: ", new_file)
-            print("genome_names_formatted: ", i)
-            new_file += "."
-            new_file += i
-            print("Filename after adding formatted genome name: ", new_file)
-            new_file += ".faa"
-            print("Filename after adding .faa extension", new_file)
-            old = os.path.join(mypath, file)
-            new = os.path.join(mypath, new_file)
-            if not os.path.exists(new):  # check if the file doesn't exist
-                os.rename(old, new)
-            print("=" * 80)
-
-        # after self.shared_folder directory is set up, run commandline section
+        # after the work_dir directory is set up, run commandline section
         print('Run subprocess of snekmer search')
         print("=" * 80)
-        cmd_string = "snekmer search"
-        cmd_process = subprocess.Popen(cmd_string, stdout=subprocess.PIPE,
-                                       stderr=subprocess.STDOUT, cwd=self.shared_folder,
-                                       shell=True)
-        cmd_process.wait()
-        print('return code: ' + str(cmd_process.returncode))
-        print("="*80)
-        output, errors = cmd_process.communicate()
-        print("output: " + str(output) + '\n')
-        print("errors: " + str(errors) + '\n')
-        print("="*80)
+        logging.info('Running snekmer search on {} cores.'.format(processes))
+        run_command(["snekmer", "search", "--cores", str(processes)], cwd=work_dir)
+        print("=" * 80)
 
         # set up output directory for output files
-        result_directory = os.path.join(self.shared_folder, "output", "search", "")
+        result_directory = os.path.join(work_dir, "output", "search", "")
         output_files = list()
         output_directory = os.path.join(self.shared_folder, str(uuid.uuid4()))
         os.makedirs(output_directory)
@@ -297,15 +273,12 @@ class Snekmer:
         print("result_file: " + result_file)
         print("=" * 80)
 
-        # zip output files for the KBase report
+        # zip the search csv outputs for the KBase report and analyze them in the same pass
+        print("Starting to analyze the csvs: ")
         with zipfile.ZipFile(result_file, 'w',
                              zipfile.ZIP_DEFLATED,
                              allowZip64=True) as zip_file:
-            for root, dirs, files in os.walk(result_directory):
-                for file in files:
-                    if file.endswith('.csv'):
-                        zip_file.write(os.path.join(root, file),
-                                       os.path.join(os.path.basename(root), file))
+            search_results = aggregate_search_results(result_directory, zip_file)
 
         output_files.append({
             'path': result_file,
@@ -313,23 +286,9 @@ class Snekmer:
             'label': os.path.basename(result_file),
             'description': 'Files generated by Snekmer Search'})
 
-        # analyze csv outputs for the KBase report
-        # combine the Search csv outputs into one csv
-
-        print("Starting to analyze the csvs: ")
-        filelist = []
-        for root, dirs, files in os.walk(result_directory):
-            for file in files:
-                if file.endswith(".csv"):
-                    filelist.append(os.path.join(root, file))
-
-        combined_csv = pd.concat([pd.read_csv(f) for f in filelist])
-        combined_csv.to_csv("combined_csv.csv", index=False, encoding='utf-8-sig')
-
-        unique_seq = len(pd.unique(combined_csv['sequence_id']))
-        total_seq = len(combined_csv.index)
-        TF_counts = combined_csv['in_family'].value_counts().to_frame()
-        TF_counts = TF_counts.rename(columns={'in_family': 'Count'})
+        unique_seq = search_results.unique_sequences
+        total_seq = search_results.total_rows
+        TF_counts = search_results.in_family_frame()
         print()
         print(TF_counts)
 
@@ -341,96 +300,65 @@ class Snekmer:
                          "Alphabet: {1}\n" \
                          "Genomes run: {2}\n" \
                          "Number of sequences: {3}\n" \
-                         "Number of searches: {4}\n\n" \
-                         "Sequences in a family: \n{5}".format(str(k), alphabet, genome_names,
-                                                               unique_seq, total_seq, TF_counts)
+                         "Number of searches: {4}\n" \
+                         "Cores used: {5}\n" \
+                         "Families searched: {6}\n\n" \
+                         "Sequences in a family: \n{7}".format(str(k), alphabet, genome_names,
+                                                               unique_seq, total_seq, processes,
+                                                               ', '.join(families) if families
+                                                               else 'all', TF_counts)
         print("Report message:\n")
         print(report_message)
 
         # previous genome annotation section
         logging.info("Annotating the Genomes.")
-        # for now annotate the first 5 genes with my lovely message to prove I can do it
-        # df with snekmer search result hits, then remove unnecessary columns
-        true_df = combined_csv.loc[combined_csv['in_family'] == True]
-        true_df = true_df.loc[:, ['filename', 'sequence_id', 'model']]
-
-        # genome_data genomes should be in same order as the genomes in genome_names_formatted
-        # need if statements for 'functions' vs 'function' because of the differences in genome object versions
-
-        # for each genome object and its formatted name
-        for j, names in zip(genome_data, genome_names_formatted):
-            print("\n Annotate Genome")
-            print('in genome_data loop for name: ', names)
-            length = len(j['data']['features'])
-            print("length of features list: ", length)
-            #test_length = int(length/200)
-            #print("test length to use for now: ", test_length, "\n")
-            # subset the search results for only this genome's results
-            x = true_df.loc[(true_df['filename'].str.contains(names))]
-
-            # for all the features in the genome
-            for i in range(length):
-                print("**** now attempt to annotate **** \n")
-                # later- maybe just check one feature to see if it has functions or function? or
-                # check genome object version number?
-                if 'functions' in j['data']['features'][i]:
-                    print("i: ", i)
-                    print("has id: ", j['data']["features"][i]["id"])
-                    print("has functions: ", j['data']["features"][i]["functions"])
-
-                    # for each id in the snekmer results
-                    for count, l in enumerate(x['sequence_id']):
-                        # if those ids are the same
-                        if j['data']["features"][i]["id"] == l:
-                            print("index in kbase: ", i)
-                            print("index in snekmer results: ", count)
-                            # get the model value using index of the snekmer id
-                            new_model = x['model'].values[count]
-                            print("new model to add to kbase: ", new_model)
-                            # append that model to the kbase features
-                            j['data']["features"][i]["functions"].append(new_model)
-                            print("add new: ", j['data']["features"][i]["functions"])
-                            print("")
-
-                if 'function' in j['data']['features'][i]:
-                    print("i: ", i)
-                    print("has id: ", j['data']["features"][i]["id"])
-                    print("has function: ", j['data']["features"][i]["function"])
-                    print("**** now attempt to annotate **** \n")
-
-                    # for each id in the snekmer results
-                    for count, l in enumerate(x['sequence_id']):
-                        # if those ids are the same
-                        if j['data']["features"][i]["id"] == l:
-                            print("index in kbase: ", i)
-                            print("index in snekmer results: ", count)
-                            # get the model value using index of the snekmer id
-                            new_model = x['model'].values[count]
-                            print("new model to add to kbase: ", new_model)
-                            # append that model to the kbase features
-                            j['data']['features'][i]['function'] = ", ".join(
-                                [j['data']['features'][i]['function'], new_model])
-                            print("add new: ", j['data']["features"][i]["function"])
-                            print("")
+        # in-family hits indexed as filename -> sequence_id -> models
+        hit_index = search_results.hit_index
+
+        # spooled genomes are in the same order as the genomes in genome_names_formatted
+        # load one genome at a time from the spool for each formatted name
+        annotation_counter = AnnotationCounter()
+        deltas = []
+        for index, names in enumerate(genome_names_formatted):
+            features = genome_spool.load(index)['data']['features']
+            # subset the search results for only this genome's input file
+            genome_hits = hits_for_genome(hit_index,
+                                          fasta_file_name(genome_summaries[index], names))
+            # feature id -> models to add
+            deltas.append(annotation_counter.compute_delta(names, features, genome_hits))
+            del features
+        logging.info('Annotation finished: ' + annotation_counter.summary())
+        modified = [bool(delta) for delta in deltas]
+
+        # keep the annotation deltas with the report as a small sidecar file
+        delta_file = os.path.join(output_directory, "annotation_delta.json")
+        with open(delta_file, 'w') as file:
+            json.dump([{'name': name, 'ref': ref, 'delta': delta}
+                       for name, ref, delta in zip(genome_names, refs, deltas) if delta],
+                      file)
+        output_files.append({
+            'path': delta_file,
+            'name': os.path.basename(delta_file),
+            'label': os.path.basename(delta_file),
+            'description': 'Snekmer models added to each annotated Genome feature'})
 
         logging.info("Saving the annotated Genomes as individual Genome objects.")
-        # save the annotated genomes as new genome objects, with new refs
-        new_refs = []
-        new_names = []
-        for i in genome_data:
-            # format the organism name into what's acceptable for an object name
-            # example- gfu.save_one_genome claimed "Desulfovibrio vulgaris str. 'Miyazaki F'" had an illegal character
-            stringName = i['data']['scientific_name']
-            obj_name = "_".join(stringName.split())
-            obj_name2 = obj_name.replace("'", "_")
-            # save the annotated genome object and grab its info
-            info = self.gfu.save_one_genome({"workspace": workspace_name,
-                                             "name": obj_name2,
-                                             "data": i['data']})["info"]
-            # get ref of new annotated genome
-            save_ref = str(info[6]) + "/" + str(info[0]) + "/" + str(info[4])
-            new_refs.append(save_ref)
-            new_names.append(stringName)
+        # save only the genomes that gained annotations as new genome objects, with new refs;
+        # unchanged genomes keep their original ref in the output GenomeSet
+        # each changed genome is fetched in full, patched with its delta and saved
+        # the formatted organism name is what's acceptable for an object name
+        # example- gfu.save_one_genome claimed "Desulfovibrio vulgaris str. 'Miyazaki F'" had an illegal character
+        saved_refs = iter(save_annotated_genomes(
+            self.genome_api, self.gfu, workspace_name,
+            [(ref, name, delta) for ref, name, delta in zip(refs, genome_names_formatted, deltas)
+             if delta],
+            self.save_workers))
+        new_refs = [next(saved_refs) if changed else ref for ref, changed in zip(refs, modified)]
+        new_names = genome_names
+        saves_avoided = modified.count(False)
+        logging.info('Skipped saving {} unchanged genomes.'.format(saves_avoided))
+        report_message += "\nGenome saves avoided (no new annotations): {}".format(saves_avoided)
+        report_message += "\nPeak memory: {:.0f} MB".format(peak_memory_mb())
 
         logging.info("Saving the new Genomes into a new GenomeSet object.")
         # save annotated genomes into genomeset object, then get that new ref to pass into the report
@@ -471,6 +399,11 @@ class Snekmer:
         report_client = KBaseReport(self.callback_url)
         report_info = report_client.create_extended_report(report_params)
 
+        # connection reuse of the clients that made the most calls in this run
+        for name, client in (('Workspace', self.wsClient), ('GenomeAnnotationAPI', self.genome_api),
+                             ('GenomeFileUtil', self.gfu)):
+            logging.info('{} connections: {}'.format(name, client._client.connection_stats()))
+
         # construct the output to send back
         # troubleshoot later- does the output_genome_name need to be in this output?
         # also, in the spec.json its described as Genome not GenomeSet, yet things seem to be working properly
@@ -5,6 +5,7 @@ import json
 import os
 import random as _random
 import sys
+import time
 import traceback
 from getopt import getopt, GetoptError
 from multiprocessing import Process
@@ -18,6 +19,7 @@ from jsonrpcbase import ServerError as JSONServerError
 
 from biokbase import log
 from Snekmer.authclient import KBaseAuth as _KBaseAuth
+from Snekmer.Utils.auth_cache import AuthCache
 
 try:
     from ConfigParser import ConfigParser
@@ -350,7 +352,12 @@ class Application(object):
                              name='Snekmer.status',
                              types=[dict])
         authurl = config.get(AUTH) if config else None
-        self.auth_client = _KBaseAuth(authurl)
+
+        def validate(token):
+            # AuthCache caches and refreshes tokens, so each validation uses a
+            # new KBaseAuth, whose empty token cache always asks the auth service
+            return _KBaseAuth(authurl).get_user(token)
+        self.auth_client = AuthCache(validate)
 
     def __call__(self, environ, start_response):
         # Context object, equivalent to the perl impl CallContext
@@ -408,17 +415,22 @@ class Application(object):
                         elif token is None and auth_req == 'optional':
                             pass
                         else:
+                            auth_start = time.time()
                             try:
-                                user = self.auth_client.get_user(token)
+                                user, auth_source = self.auth_client.lookup(token)
                                 ctx['user_id'] = user
                                 ctx['authenticated'] = 1
                                 ctx['token'] = token
                             except Exception as e:
+                                auth_source = 'failed'
                                 if auth_req == 'required':
                                     err = JSONServerError()
                                     err.data = \
                                         "Token validation failed: %s" % e
                                     raise err
+                            finally:
+                                self.log(log.INFO, ctx, 'auth from {} in {:.1f} ms'.format(
+                                    auth_source, (time.time() - auth_start) * 1000))
                     if (environ.get('HTTP_X_FORWARDED_FOR')):
                         self.log(log.INFO, ctx, 'X-Forwarded-For: ' +
                                  environ.get('HTTP_X_FORWARDED_FOR'))
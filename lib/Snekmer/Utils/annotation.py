@@ -0,0 +1,105 @@
+import logging
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+def build_hit_index(hits, index=None):
+    """
+    Index in-family Snekmer search hits as {filename: {sequence_id: [models]}}.
+
+    hits is a DataFrame with 'filename', 'sequence_id' and 'model' columns.
+    Models for a sequence keep the order they appear in hits. Pass an index
+    returned by an earlier call to add more hits to it.
+    """
+    if index is None:
+        index = defaultdict(lambda: defaultdict(list))
+    for filename, sequence_id, model in zip(hits['filename'], hits['sequence_id'],
+                                            hits['model']):
+        index[filename][sequence_id].append(model)
+    return index
+
+
+def hits_for_genome(index, filename):
+    """
+    Return the hits of a genome's search file as {sequence_id: [models]}.
+    filename is the genome's input FASTA name, as given by fasta_file_name.
+    """
+    return index.get(filename, {})
+
+
+def annotation_delta(features, genome_hits):
+    """
+    Compute the annotations a genome gains, as {feature id: [models]}, in a
+    single pass over features. Only features with a 'functions' list or a
+    'function' string can take annotations.
+    """
+    # checked once so the loop does not pay for formatting at INFO level
+    debug = logger.isEnabledFor(logging.DEBUG)
+    delta = {}
+    for feature in features:
+        models = genome_hits.get(feature['id'])
+        if not models or not ('functions' in feature or 'function' in feature):
+            continue
+        if debug:
+            logger.debug('feature {} gets models {}'.format(feature['id'], models))
+        delta[feature['id']] = list(models)
+    return delta
+
+
+def annotate_features(features, delta):
+    """
+    Add the models in delta to each feature's 'functions' list and/or its
+    'function' string, in a single pass over features. delta maps feature
+    ids to models, as returned by annotation_delta.
+
+    Returns the number of models added.
+    """
+    added = 0
+    for feature in features:
+        models = delta.get(feature['id'])
+        if not models:
+            continue
+        # genome object versions differ in using 'functions' or 'function'
+        if 'functions' in feature:
+            feature['functions'].extend(models)
+        if 'function' in feature:
+            feature['function'] = ", ".join([feature['function']] + models)
+        if 'functions' in feature or 'function' in feature:
+            added += len(models)
+    return added
+
+
+class AnnotationCounter(object):
+    """
+    Running totals for the annotation step, with one summary log line per genome.
+    """
+
+    def __init__(self):
+        self.genomes = 0
+        self.features_scanned = 0
+        self.annotations_added = 0
+        self.elapsed = 0.0
+
+    def compute_delta(self, genome_name, features, genome_hits):
+        """
+        Return the annotation_delta of a genome's features and count it.
+        """
+        start = time.time()
+        delta = annotation_delta(features, genome_hits)
+        added = sum(len(models) for models in delta.values())
+        elapsed = time.time() - start
+
+        self.genomes += 1
+        self.features_scanned += len(features)
+        self.annotations_added += added
+        self.elapsed += elapsed
+        logger.info('Annotated {}: {} features scanned, {} annotations added in {:.3f}s'
+                    .format(genome_name, len(features), added, elapsed))
+        return delta
+
+    def summary(self):
+        return ('{} genomes, {} features scanned, {} annotations added in {:.3f}s'
+                .format(self.genomes, self.features_scanned, self.annotations_added,
+                        self.elapsed))
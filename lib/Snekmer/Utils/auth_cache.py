@@ -0,0 +1,98 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+AUTH_CACHE_TTL = 5 * 60
+AUTH_REFRESH_MARGIN = 60
+AUTH_CACHE_MAXSIZE = 2000
+
+
+class AuthCache(object):
+    """
+    Cache of validated tokens in front of a validate(token) -> user function
+    that calls the auth service.
+
+    Tokens are trusted for ttl seconds after they were last validated. A
+    token looked up in its last refresh_margin seconds is revalidated in the
+    background while the cached user is returned, so tokens in steady use
+    never wait on the auth service. A failed background refresh leaves the
+    token cached until its ttl runs out, so an auth service outage only
+    reaches requests once their tokens expire. Concurrent lookups of a token
+    that is not cached share a single validation.
+    """
+
+    def __init__(self, validate, ttl=AUTH_CACHE_TTL, refresh_margin=AUTH_REFRESH_MARGIN,
+                 maxsize=AUTH_CACHE_MAXSIZE, refresh_workers=2):
+        self._validate = validate
+        self._ttl = ttl
+        self._refresh_margin = refresh_margin
+        self._maxsize = maxsize
+        self._refresh_workers = refresh_workers
+        self._entries = OrderedDict()  # token hash -> (user, validated time), LRU first
+        self._lookups = {}  # token hash -> Future of a validation in flight
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def _refresh_executor(self):
+        # created on first use, so a server forking workers gets one per worker
+        if self._refresher is None:
+            self._refresher = ThreadPoolExecutor(self._refresh_workers)
+        return self._refresher
+
+    def lookup(self, token):
+        """
+        Return (user, source) for token, where source is 'cache',
+        'auth service' or 'coalesced' (waited on another request's lookup).
+        """
+        if not token:
+            raise ValueError('Must supply token')
+        key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                user, validated = entry
+                age = time.time() - validated
+                if age <= self._ttl:
+                    self._entries.move_to_end(key)
+                    if age > self._ttl - self._refresh_margin and key not in self._lookups:
+                        future = self._lookups[key] = Future()
+                        self._refresh_executor().submit(self._run_validation, key, token,
+                                                        future, True)
+                    return user, 'cache'
+                del self._entries[key]
+            future = self._lookups.get(key)
+            validating = future is None
+            if validating:
+                future = self._lookups[key] = Future()
+        if validating:
+            self._run_validation(key, token, future)
+            return future.result(), 'auth service'
+        return future.result(), 'coalesced'
+
+    def get_user(self, token):
+        return self.lookup(token)[0]
+
+    def _run_validation(self, key, token, future, refresh=False):
+        try:
+            user = self._validate(token)
+        except Exception as e:
+            # a failed refresh keeps the token until its ttl runs out; otherwise
+            # drop it, so the next lookup validates it again
+            with self._lock:
+                if not refresh:
+                    self._entries.pop(key, None)
+                self._lookups.pop(key, None)
+            logging.info('Token {} failed: {}'.format(
+                'refresh' if refresh else 'validation', e))
+            future.set_exception(e)
+            return
+        with self._lock:
+            self._entries[key] = (user, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+            self._lookups.pop(key, None)
+        future.set_result(user)
@@ -0,0 +1,56 @@
+import logging
+import os
+import resource
+import subprocess
+import time
+from collections import deque
+
+ERROR_TAIL_LINES = 20
+
+
+def run_command(cmd, cwd=None):
+    """
+    Run cmd, streaming its combined stdout/stderr into the log line by line
+    while it runs.
+
+    stderr is merged into stdout and the pipe is drained as output arrives, so
+    large outputs cannot fill the pipe buffer and block the child. Raises
+    RuntimeError with the tail of the output if cmd exits with a nonzero code.
+    Returns the elapsed time in seconds.
+    """
+    logging.info('Running: ' + ' '.join(cmd))
+    start = time.time()
+    tail = deque(maxlen=ERROR_TAIL_LINES)
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          cwd=cwd, universal_newlines=True, bufsize=1) as process:
+        for line in process.stdout:
+            line = line.rstrip('\n')
+            tail.append(line)
+            logging.info(line)
+        returncode = process.wait()
+    elapsed = time.time() - start
+
+    if returncode != 0:
+        raise RuntimeError('{} failed with return code {} after {:.1f}s:\n{}'.format(
+            ' '.join(cmd), returncode, elapsed, '\n'.join(tail)))
+    logging.info('{} finished in {:.1f}s'.format(' '.join(cmd), elapsed))
+    return elapsed
+
+
+def available_cores():
+    """
+    Return the number of CPUs this process may run on, which respects the
+    container's CPU affinity rather than the host's core count.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def peak_memory_mb():
+    """
+    Return the peak resident set size of this process so far, in MB.
+    """
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
@@ -0,0 +1,51 @@
+import logging
+import os
+
+
+def protein_records(genome):
+    """
+    Yield (feature id, protein sequence) for each protein coding feature of
+    a Genome data dict.
+
+    Records come from the features list, so their ids match the features that
+    are annotated later. Genomes whose features carry no translations fall
+    back to the cdss list, named after each CDS's parent gene when it has one.
+    """
+    found = False
+    for feature in genome.get('features', []):
+        if feature.get('protein_translation'):
+            found = True
+            yield feature['id'], feature['protein_translation']
+    if not found:
+        for cds in genome.get('cdss', []):
+            if cds.get('protein_translation'):
+                yield cds.get('parent_gene') or cds['id'], cds['protein_translation']
+
+
+def fasta_file_name(genome, formatted_name):
+    """
+    Name a genome's protein FASTA as <id>.<formatted_name>.faa. Periods in the
+    genome id are replaced, so everything before the first period is the id.
+    """
+    return '{}.{}.faa'.format(genome['id'].replace('.', '_'), formatted_name)
+
+
+def write_protein_fasta(genome, formatted_name, output_dir):
+    """
+    Write the protein FASTA of a Genome data dict into output_dir and return its path.
+    """
+    path = os.path.join(output_dir, fasta_file_name(genome, formatted_name))
+    count = 0
+    with open(path, 'w') as fasta:
+        for record_id, sequence in protein_records(genome):
+            fasta.write('>{}\n{}\n'.format(record_id, sequence))
+            count += 1
+    logging.info('Wrote {} protein sequences to {}'.format(count, path))
+    return path
+
+
+def format_genome_name(genome):
+    """
+    Format a genome's scientific name into what's acceptable for an object name.
+    """
+    return "_".join(genome['scientific_name'].split()).replace("'", "_")
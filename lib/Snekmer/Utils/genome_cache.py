@@ -0,0 +1,99 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+
+DEFAULT_CACHE_MAX_MB = 2048
+
+# only ws_id/obj_id/version refs always point at the same data
+_VERSIONED_REF = re.compile(r'^\d+/\d+/\d+$')
+
+
+class GenomeCache(object):
+    """
+    A size-bounded, least recently used on-disk cache of fetched genome data,
+    keyed by versioned workspace ref.
+
+    key_salt is mixed into every key, so data fetched with a different set
+    of included paths is never served from the cache.
+    """
+
+    def __init__(self, directory, max_mb=DEFAULT_CACHE_MAX_MB, key_salt=''):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.key_salt = key_salt
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def cacheable(ref):
+        return bool(_VERSIONED_REF.match(ref))
+
+    def _path(self, ref):
+        key = hashlib.sha256((self.key_salt + ref).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.json.gz')
+
+    def get(self, ref):
+        """
+        Return the cached genome for ref, or None on a miss.
+        """
+        path = self._path(ref)
+        if not self.cacheable(ref) or not os.path.exists(path):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            with gzip.open(path, 'rt') as cache_file:
+                genome = json.load(cache_file)
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError):
+            # evicted or being replaced by another job
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return genome
+
+    def put(self, ref, genome):
+        """
+        Cache a genome fetched for ref, if ref is versioned, then evict the
+        least recently used entries until the cache fits max_mb.
+        """
+        if not self.cacheable(ref):
+            return
+        path = self._path(ref)
+        tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with gzip.open(tmp_path, 'wt', compresslevel=1) as cache_file:
+            json.dump(genome, cache_file)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith('.json.gz'):
+                    try:
+                        stat = os.stat(os.path.join(self.directory, name))
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+
+    def summary(self):
+        return '{} hits, {} misses, {} evictions'.format(self.hits, self.misses, self.evictions)
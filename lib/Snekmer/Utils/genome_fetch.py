@@ -0,0 +1,77 @@
+import asyncio
+import logging
+
+from installed_clients.asyncbaseclient import make_async
+
+DEFAULT_FETCH_WORKERS = 8
+
+# the only parts of a Genome that naming, FASTA export and annotation read
+GENOME_READ_PATHS = ['id',
+                     'scientific_name',
+                     'features/[*]/id',
+                     'features/[*]/function',
+                     'features/[*]/functions',
+                     'features/[*]/protein_translation',
+                     'cdss/[*]/id',
+                     'cdss/[*]/parent_gene',
+                     'cdss/[*]/protein_translation']
+
+
+def fetch_genome_projections(ws_client, refs, max_workers=DEFAULT_FETCH_WORKERS,
+                             on_fetched=None, cache=None):
+    """
+    Fetch only the GENOME_READ_PATHS of each genome ref with
+    Workspace.get_objects2, leaving out contigs, mRNAs, ontology events and
+    the rest of the feature fields.
+
+    Up to max_workers requests are in flight at once. If on_fetched is given it
+    is called as on_fetched(index, genome) in a worker thread as soon as each
+    genome arrives, overlapping with the remaining downloads, and its return
+    value replaces the genome in the result. A worker only fetches its next
+    genome once on_fetched returns. The returned list is in the same
+    order as refs, so it can be zipped with anything derived from the
+    GenomeSet elements.
+
+    If a GenomeCache is given, genomes are read from it when present and
+    stored in it after they are fetched.
+    """
+    ws_client = make_async(ws_client)
+
+    async def fetch_one(ref):
+        loop = asyncio.get_running_loop()
+        if cache is not None:
+            genome = await loop.run_in_executor(None, cache.get, ref)
+            if genome is not None:
+                return genome
+        genome = (await ws_client.get_objects2({'objects': [{'ref': ref,
+                                                             'included': GENOME_READ_PATHS}]
+                                                }))['data'][0]
+        if cache is not None:
+            await loop.run_in_executor(None, cache.put, ref, genome)
+        return genome
+
+    return _fetch(fetch_one, refs, max_workers, on_fetched)
+
+
+def _fetch(fetch_one, refs, max_workers, on_fetched):
+    max_workers = max(1, min(int(max_workers), len(refs) or 1))
+    logging.info('Fetching {} genomes with {} workers.'.format(len(refs), max_workers))
+    return asyncio.run(_fetch_all(fetch_one, refs, max_workers, on_fetched))
+
+
+async def _fetch_all(fetch_one, refs, max_workers, on_fetched):
+    semaphore = asyncio.Semaphore(max_workers)
+    loop = asyncio.get_running_loop()
+
+    async def fetch_and_process(index, ref):
+        # on_fetched runs under the semaphore too, so no more than
+        # max_workers genomes are held at once while it works through them
+        async with semaphore:
+            logging.info('Fetching genome ' + ref)
+            genome = await fetch_one(ref)
+            if on_fetched is not None:
+                genome = await loop.run_in_executor(None, on_fetched, index, genome)
+        return genome
+
+    # gather returns results in the order of its arguments
+    return await asyncio.gather(*[fetch_and_process(i, ref) for i, ref in enumerate(refs)])
@@ -0,0 +1,53 @@
+import asyncio
+import logging
+
+from installed_clients.asyncbaseclient import make_async
+from Snekmer.Utils.annotation import annotate_features
+
+DEFAULT_SAVE_WORKERS = 4
+
+
+def info_to_ref(info):
+    """Build a wsid/objid/version ref from a workspace object_info tuple."""
+    return '{}/{}/{}'.format(info[6], info[0], info[4])
+
+
+def save_annotated_genomes(genome_api, gfu, workspace_name, patches,
+                           max_workers=DEFAULT_SAVE_WORKERS):
+    """
+    Apply annotation deltas to genomes and save them as new objects.
+
+    patches is a list of (genome ref, object name, delta) where delta maps
+    feature ids to the models they gain. Each genome is fetched in full
+    right before its save, patched with annotate_features, saved and
+    released, so at most max_workers full genomes are held in memory.
+
+    Returns the refs of the saved genomes in the same order as patches.
+    """
+    max_workers = max(1, min(int(max_workers), len(patches) or 1))
+    logging.info('Patching and saving {} genomes with {} workers.'.format(
+        len(patches), max_workers))
+    return asyncio.run(_patch_all(make_async(genome_api), make_async(gfu), workspace_name,
+                                  patches, max_workers))
+
+
+async def _patch_all(genome_api, gfu, workspace_name, patches, max_workers):
+    semaphore = asyncio.Semaphore(max_workers)
+    loop = asyncio.get_running_loop()
+
+    async def patch_one(ref, name, delta):
+        async with semaphore:
+            genome = (await genome_api.get_genome_v1({'genomes': [{'ref': ref}],
+                                                      'downgrade': 0}))['genomes'][0]
+            added = await loop.run_in_executor(None, annotate_features,
+                                               genome['data']['features'], delta)
+            info = (await gfu.save_one_genome({'workspace': workspace_name,
+                                               'name': name,
+                                               'data': genome['data']}))['info']
+            del genome
+        ref = info_to_ref(info)
+        logging.info('Saved genome {} with {} new annotations as {}'.format(name, added, ref))
+        return ref
+
+    return await asyncio.gather(*[patch_one(ref, name, delta)
+                                  for ref, name, delta in patches])
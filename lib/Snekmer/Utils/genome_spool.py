@@ -0,0 +1,35 @@
+import gzip
+import json
+import os
+
+
+class GenomeSpool(object):
+    """
+    Keep fetched genome data on local disk between the FASTA export and the
+    annotation step, so only one genome needs to be in memory at a time.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, index):
+        return os.path.join(self.directory, '{}.json.gz'.format(index))
+
+    def put(self, index, genome):
+        """
+        Spool a fetched genome under index and return a summary holding only
+        its id and scientific_name. Protein translations are not spooled, as
+        they are only needed for the FASTA export.
+        """
+        data = genome['data']
+        for feature in data.get('features', []):
+            feature.pop('protein_translation', None)
+        data.pop('cdss', None)
+        with gzip.open(self._path(index), 'wt', compresslevel=1) as spool_file:
+            json.dump(genome, spool_file)
+        return {'id': data['id'], 'scientific_name': data['scientific_name']}
+
+    def load(self, index):
+        with gzip.open(self._path(index), 'rt') as spool_file:
+            return json.load(spool_file)
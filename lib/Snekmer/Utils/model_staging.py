@@ -0,0 +1,80 @@
+import logging
+import os
+import shutil
+
+MODEL_OUTPUT_DIR = '/kb/module/data/model_output'
+STAGING_MODES = ('shared', 'copy')
+
+
+def model_families(source_dir):
+    """
+    List the families with a scorer in the Snekmer model_output source_dir.
+    """
+    return sorted(name[:-len('.scorer')]
+                  for name in os.listdir(os.path.join(source_dir, 'scoring'))
+                  if name.endswith('.scorer'))
+
+
+def _copy_family_files(source_dir, staging_dir, families, extension):
+    os.makedirs(staging_dir)
+    for family in families:
+        shutil.copy2(os.path.join(source_dir, family + extension), staging_dir)
+
+
+def _link_family_files(source_dir, staging_dir, families, extension):
+    os.makedirs(staging_dir)
+    for family in families:
+        os.symlink(os.path.join(source_dir, family + extension),
+                   os.path.join(staging_dir, family + extension))
+
+
+def stage_model_output(source_dir, staging_dir, mode='shared', families=None):
+    """
+    Make the Snekmer model_output available to snekmer search and return the
+    model_dir, basis_dir and score_dir entries for its config.yaml.
+
+    mode 'copy' copies the whole of source_dir into staging_dir.
+    mode 'shared' reads the models and scorers straight from source_dir. Only
+    basis_dir is staged, as a directory of symlinks to the .kmers files,
+    because snekmer search writes search_kmers.txt and its log into basis_dir.
+
+    If families is given, only those families are staged: model_dir,
+    basis_dir and score_dir are then all directories of symlinks (or copies,
+    in 'copy' mode) of the selected families' files.
+    """
+    if mode not in STAGING_MODES:
+        raise ValueError('model output mode must be one of {}, got {}'.format(
+            ', '.join(STAGING_MODES), mode))
+
+    if families:
+        available = model_families(source_dir)
+        unknown = sorted(set(families) - set(available))
+        if unknown:
+            raise ValueError('Unknown families {}; available families are {}'.format(
+                ', '.join(unknown), ', '.join(available)))
+        link = _copy_family_files if mode == 'copy' else _link_family_files
+        for subdir, extension in (('model', '.model'), ('kmerize', '.kmers'),
+                                  ('scoring', '.scorer')):
+            link(os.path.join(source_dir, subdir), os.path.join(staging_dir, subdir),
+                 sorted(set(families)), extension)
+        model_root = staging_dir
+        basis_dir = os.path.join(staging_dir, 'kmerize')
+    elif mode == 'copy':
+        shutil.copytree(source_dir, staging_dir)
+        model_root = staging_dir
+        basis_dir = os.path.join(staging_dir, 'kmerize')
+    else:
+        model_root = source_dir
+        basis_dir = os.path.join(staging_dir, 'kmerize')
+        os.makedirs(basis_dir)
+        source_basis_dir = os.path.join(source_dir, 'kmerize')
+        for name in os.listdir(source_basis_dir):
+            if name.endswith('.kmers'):
+                os.symlink(os.path.join(source_basis_dir, name),
+                           os.path.join(basis_dir, name))
+
+    logging.info('Staged {} families of model output from {} in {} mode.'.format(
+        len(set(families)) if families else 'all', source_dir, mode))
+    return {'model_dir': os.path.join(model_root, 'model', ''),
+            'basis_dir': os.path.join(basis_dir, ''),
+            'score_dir': os.path.join(model_root, 'scoring', '')}
@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import pickle
+from collections import namedtuple
+
+import numpy as np
+
+MODEL_STORE_DIR = '/kb/module/data/model_store'
+MANIFEST_NAME = 'manifest.json'
+
+FamilyModel = namedtuple('FamilyModel', ['family', 'alphabet', 'k', 'basis', 'weights',
+                                         'scaler_index', 'score_norm', 'coef', 'intercept',
+                                         'classes'])
+
+
+class _PickledObject(object):
+    """
+    Attribute holder standing in for the snekmer and sklearn classes in the
+    model output pickles, so the store can be built from their state alone.
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
+class _ModelUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module.split('.')[0] in ('snekmer', 'sklearn'):
+            return type(name, (_PickledObject,), {'__module__': module})
+        return super().find_class(module, name)
+
+
+def _load_pickle(path):
+    with open(path, 'rb') as pickle_file:
+        return _ModelUnpickler(pickle_file).load()
+
+
+def _kmer_array(kmers, k):
+    return np.array([kmer.encode('ascii') for kmer in kmers], dtype='S{}'.format(k))
+
+
+def build_model_store(source_dir, store_dir):
+    """
+    Convert the pickled models, k-mer bases and scorers of a snekmer
+    model_output dir into .npy arrays plus a JSON manifest in store_dir.
+
+    For each family, {family}.basis.npy holds the ordered basis k-mers,
+    {family}.weights.npy the scorer feature weights and
+    {family}.scaler_index.npy the basis indices kept by the score scaler.
+    Scalars and the logistic regression parameters go in the manifest.
+    Returns the manifest.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    manifest = {'families': {}}
+    for scorer_name in sorted(os.listdir(os.path.join(source_dir, 'scoring'))):
+        if not scorer_name.endswith('.scorer'):
+            continue
+        family = scorer_name[:-len('.scorer')]
+        kmers = _load_pickle(os.path.join(source_dir, 'kmerize', family + '.kmers'))
+        scorer = _load_pickle(os.path.join(source_dir, 'scoring', scorer_name))
+        model = _load_pickle(os.path.join(source_dir, 'model', family + '.model'))
+
+        basis = kmers.kmer_set._kmerlist
+        if list(scorer.kmers.basis) != list(basis):
+            raise ValueError('Scorer basis for {} does not match {}.kmers'.format(family, family))
+        np.save(os.path.join(store_dir, family + '.basis.npy'), _kmer_array(basis, kmers.k))
+        np.save(os.path.join(store_dir, family + '.weights.npy'),
+                np.asarray(scorer.probabilities['sample'], dtype=np.float64))
+        np.save(os.path.join(store_dir, family + '.scaler_index.npy'),
+                np.asarray(scorer.scaler.basis_index, dtype=np.int64))
+
+        manifest['families'][family] = {
+            'alphabet': kmers.alphabet,
+            'k': kmers.k,
+            'score_norm': float(scorer.score_norm),
+            'coef': model.coef_.ravel().tolist(),
+            'intercept': model.intercept_.ravel().tolist(),
+            'classes': model.classes_.tolist()}
+        logging.info('Stored model for {} ({} basis k-mers)'.format(family, len(basis)))
+
+    with open(os.path.join(store_dir, MANIFEST_NAME), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return manifest
+
+
+class ModelStore(object):
+    """
+    Read-only access to a store written by build_model_store. Arrays are
+    memory-mapped, so loading a family is cheap and the pages are shared
+    between processes reading the same store.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, MANIFEST_NAME)) as manifest_file:
+            self.manifest = json.load(manifest_file)
+
+    @property
+    def families(self):
+        return sorted(self.manifest['families'])
+
+    def _array(self, family, name):
+        return np.load(os.path.join(self.store_dir, '{}.{}.npy'.format(family, name)),
+                       mmap_mode='r')
+
+    def load(self, family):
+        if family not in self.manifest['families']:
+            raise ValueError('No model for family {} in {}'.format(family, self.store_dir))
+        entry = self.manifest['families'][family]
+        return FamilyModel(family=family,
+                           alphabet=entry['alphabet'],
+                           k=entry['k'],
+                           basis=self._array(family, 'basis'),
+                           weights=self._array(family, 'weights'),
+                           scaler_index=self._array(family, 'scaler_index'),
+                           score_norm=entry['score_norm'],
+                           coef=np.array(entry['coef']),
+                           intercept=np.array(entry['intercept']),
+                           classes=np.array(entry['classes']))
@@ -0,0 +1,62 @@
+import logging
+import os
+from collections import Counter
+
+import pandas as pd
+
+from Snekmer.Utils.annotation import build_hit_index
+
+SEARCH_COLUMNS = ['filename', 'sequence_id', 'model', 'in_family']
+SEARCH_DTYPES = {'filename': 'category', 'sequence_id': str, 'model': 'category',
+                 'in_family': bool}
+
+
+class SearchResultAggregator(object):
+    """
+    Report statistics and the in-family hit index for snekmer search CSVs,
+    built up one file at a time so only one file's frame is held in memory.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.total_rows = 0
+        self.sequence_ids = set()
+        self.in_family_counts = Counter()
+        self.hit_index = build_hit_index(pd.DataFrame(columns=SEARCH_COLUMNS))
+
+    def add(self, path):
+        results = pd.read_csv(path, usecols=SEARCH_COLUMNS, dtype=SEARCH_DTYPES)
+        self.files += 1
+        self.total_rows += len(results.index)
+        self.sequence_ids.update(results['sequence_id'])
+        self.in_family_counts.update(results['in_family'])
+        build_hit_index(results.loc[results['in_family']], self.hit_index)
+
+    @property
+    def unique_sequences(self):
+        return len(self.sequence_ids)
+
+    def in_family_frame(self):
+        """
+        The in_family value counts as a one column 'Count' frame, most common first.
+        """
+        counts = self.in_family_counts.most_common()
+        return pd.DataFrame({'Count': [count for _, count in counts]},
+                            index=pd.Index([value for value, _ in counts], name='in_family'))
+
+
+def aggregate_search_results(result_directory, zip_file):
+    """
+    Walk result_directory once, writing every search CSV into the open
+    zip_file and feeding it to a SearchResultAggregator, which is returned.
+    """
+    aggregator = SearchResultAggregator()
+    for root, dirs, files in os.walk(result_directory):
+        for file in sorted(files):
+            if file.endswith('.csv'):
+                path = os.path.join(root, file)
+                zip_file.write(path, os.path.join(os.path.basename(root), file))
+                aggregator.add(path)
+    logging.info('Aggregated {} rows from {} search result files.'.format(
+        aggregator.total_rows, aggregator.files))
+    return aggregator
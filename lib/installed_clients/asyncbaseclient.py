@@ -0,0 +1,57 @@
+'''
+An asyncio layer over the KBase base client.
+
+The HTTP calls themselves are made by a BaseClient in the event loop's
+default executor, while pending jobs are waited on by the BaseClient's job
+poller, which checks all of them together from one thread. Any generated
+service client can be made awaitable with make_async:
+
+    gfu = make_async(GenomeFileUtil(callback_url))
+    info = await gfu.save_one_genome(params)
+'''
+import asyncio as _asyncio
+import copy as _copy
+import functools as _functools
+
+
+class AsyncBaseClient(object):
+    '''
+    Async counterpart of BaseClient, wrapping an existing BaseClient so its
+    url, auth headers, connection pool and job check settings are shared.
+    '''
+
+    def __init__(self, client):
+        self._client = client
+
+    async def _run(self, func, *args):
+        loop = _asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _functools.partial(func, *args))
+
+    async def call_method(self, service_method, args, service_ver=None,
+                          context=None):
+        '''
+        Call a standard or dynamic service, see BaseClient.call_method.
+        '''
+        return await self._run(self._client.call_method, service_method, args,
+                               service_ver, context)
+
+    async def run_job(self, service_method, args, service_ver=None,
+                      context=None):
+        '''
+        Run a SDK method asynchronously, see BaseClient.run_job.
+        '''
+        client = self._client
+        mod, _ = service_method.split('.')
+        job_id = await self._run(client._submit_job, service_method, args,
+                                 service_ver, context)
+        return await _asyncio.wrap_future(client._job_poller.add(mod, job_id))
+
+
+def make_async(service_client):
+    '''
+    Return a copy of a generated service client (e.g. GenomeFileUtil) whose
+    methods return awaitables instead of blocking.
+    '''
+    async_client = _copy.copy(service_client)
+    async_client._client = AsyncBaseClient(service_client._client)
+    return async_client
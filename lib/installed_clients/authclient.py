@@ -9,30 +9,42 @@ import time as _time
 import requests as _requests
 import threading as _threading
 import hashlib
+from collections import OrderedDict as _OrderedDict
 
 
 class TokenCache(object):
-    ''' A basic cache for tokens. '''
+    '''
+    A basic least recently used cache for tokens. Entries expire ttl seconds
+    after they are added, and are dropped when next looked up after that.
+    '''
 
     _MAX_TIME_SEC = 5 * 60  # 5 min
 
-    _lock = _threading.RLock()
-
-    def __init__(self, maxsize=2000):
-        self._cache = {}
+    def __init__(self, maxsize=2000, ttl=_MAX_TIME_SEC):
+        self._cache = _OrderedDict()  # least recently used first
         self._maxsize = maxsize
-        self._halfmax = maxsize / 2  # int division to round down
+        self._ttl = ttl
+        self._lock = _threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
 
     def get_user(self, token):
         token = hashlib.sha256(token.encode('utf-8')).hexdigest()
         with self._lock:
             usertime = self._cache.get(token)
-        if not usertime:
-            return None
-
-        user, intime = usertime
-        if _time.time() - intime > self._MAX_TIME_SEC:
-            return None
+            if not usertime:
+                self.misses += 1
+                return None
+            user, intime = usertime
+            if _time.time() - intime > self._ttl:
+                del self._cache[token]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._cache.move_to_end(token)
+            self.hits += 1
         return user
 
     def add_valid_token(self, token, user):
@@ -42,17 +54,22 @@ class TokenCache(object):
             raise ValueError('Must supply user')
         token = hashlib.sha256(token.encode('utf-8')).hexdigest()
         with self._lock:
-            self._cache[token] = [user, _time.time()]
-            if len(self._cache) > self._maxsize:
-                sorted_items = sorted(
-                    list(self._cache.items()),
-                    key=(lambda v: v[1][1])
-                )
-                for i, (t, _) in enumerate(sorted_items):
-                    if i <= self._halfmax:
-                        del self._cache[t]
-                    else:
-                        break
+            self._cache[token] = (user, _time.time())
+            self._cache.move_to_end(token)
+            while len(self._cache) > self._maxsize:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        '''
+        Return the cache size and its hit, miss, eviction and expiration counts.
+        '''
+        with self._lock:
+            return {'size': len(self._cache),
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations}
 
 
 class KBaseAuth(object):
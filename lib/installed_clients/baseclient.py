@@ -7,13 +7,27 @@
 
 from __future__ import print_function
 
+import abc as _abc
 import json as _json
 import requests as _requests
 import random as _random
 import os as _os
+import re as _re
+import threading as _threading
 import traceback as _traceback
+from concurrent.futures import Future as _Future
+from concurrent.futures import TimeoutError as _TimeoutError
+from concurrent.futures import wait as _wait_futures
+from requests.adapters import HTTPAdapter as _HTTPAdapter
 from requests.exceptions import ConnectionError
+from requests.exceptions import HTTPError as _HTTPError
 from urllib3.exceptions import ProtocolError
+from urllib3.util.retry import Retry as _Retry
+
+try:
+    import orjson as _orjson  # optional fast JSON decoder
+except ImportError:
+    _orjson = None
 
 try:
     from configparser import ConfigParser as _ConfigParser  # py 3
@@ -30,6 +44,13 @@ _CT = 'content-type'
 _AJ = 'application/json'
 _URL_SCHEME = frozenset(['http', 'https'])
 _CHECK_JOB_RETRYS = 3
+_POOL_MAXSIZE = 10
+_CONNECT_RETRIES = 3
+_RETRY_BACKOFF_FACTOR = 0.5
+_STREAM_CHUNK_SIZE = 64 * 1024
+_METHOD_NOT_FOUND = -32601
+# a run of this many digits may be an integer orjson can't hold in 64 bits
+_LONG_DIGITS = _re.compile(b'[0-9]{19}')
 
 
 def _get_token(user_id, password, auth_svc):
@@ -97,6 +118,246 @@ class _JSONObjectEncoder(_json.JSONEncoder):
         return _json.JSONEncoder.default(self, obj)
 
 
+def _encode_body(arg_hash, stream=False):
+    '''
+    Encode a JSON-RPC request body.
+    If stream is True, the body is a generator of encoded chunks that
+    requests sends with chunked transfer encoding, so the full JSON string
+    is never built in memory. orjson is not used here, as it encodes NaN and
+    Infinity as null where the standard encoder keeps them.
+    '''
+    if stream:
+        return _iterencode_chunks(arg_hash)
+    return _json.dumps(arg_hash, cls=_JSONObjectEncoder)
+
+
+def _iterencode_chunks(obj):
+    chunk = []
+    size = 0
+    for part in _JSONObjectEncoder().iterencode(obj):
+        chunk.append(part)
+        size += len(part)
+        if size >= _STREAM_CHUNK_SIZE:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
+
+
+def _decode_body(content):
+    '''
+    Decode a JSON-RPC response body from bytes, without first building a
+    decoded str copy of it.
+    orjson turns integers over 64 bits into floats and rejects NaN and
+    Infinity, which Python services send, so bodies that may hold either
+    are decoded by the standard decoder.
+    '''
+    if _orjson is not None and not _LONG_DIGITS.search(content):
+        try:
+            return _orjson.loads(content)
+        except _orjson.JSONDecodeError:
+            pass
+    return _json.loads(content)
+
+
+def _job_finished(job_state):
+    if isinstance(job_state, Exception):
+        raise job_state
+    return job_state['finished']
+
+
+def _job_result(job_state):
+    if not job_state['result']:
+        return
+    if len(job_state['result']) == 1:
+        return job_state['result'][0]
+    return job_state['result']
+
+
+class JobWaitStrategy(_abc.ABC):
+    '''
+    Decides how BaseClient waits for submitted SDK jobs. wait returns the
+    final job states of job_ids, in the same order. batch_checks is True
+    for strategies that check jobs with the _check_jobs batch method.
+    '''
+
+    batch_checks = False
+
+    @_abc.abstractmethod
+    def wait(self, client, service, job_ids):
+        pass
+
+
+class BackoffWaitStrategy(JobWaitStrategy):
+    '''
+    Check the outstanding jobs with _check_job, sleeping between checks for
+    a time that starts at initial_time seconds, grows by scale_percent up to
+    max_time and is spread by +/- jitter so many waiting clients do not
+    check in lockstep. With batch_checks, all outstanding jobs are checked
+    with one call to the service's _check_jobs method, for servers that
+    have it.
+    '''
+
+    def __init__(self, initial_time=0.1, scale_percent=150, max_time=300,
+                 jitter=0.1, batch_checks=False):
+        self.initial_time = initial_time
+        self.scale_percent = scale_percent
+        self.max_time = max_time
+        self.jitter = jitter
+        self.batch_checks = batch_checks
+
+    def delays(self):
+        delay = self.initial_time
+        while True:
+            yield delay * _random.uniform(1 - self.jitter, 1 + self.jitter)
+            delay = min(delay * self.scale_percent / 100.0, self.max_time)
+
+    def wait(self, client, service, job_ids):
+        return self.wait_pending(client, service, job_ids, {})
+
+    def wait_pending(self, client, service, job_ids, states):
+        check_job_failures = 0
+        delays = self.delays()
+        while check_job_failures < _CHECK_JOB_RETRYS:
+            time.sleep(next(delays))
+            pending = [job_id for job_id in job_ids if job_id not in states]
+            try:
+                checked = client._check_jobs(service, pending,
+                                             batch=self.batch_checks)
+            except (ConnectionError, ProtocolError):
+                _traceback.print_exc()
+                check_job_failures += 1
+                continue
+            states.update((job_id, job_state) for job_id, job_state in checked.items()
+                          if _job_finished(job_state))
+            if all(job_id in states for job_id in job_ids):
+                return [states[job_id] for job_id in job_ids]
+        raise RuntimeError("_check_job failed {} times and exceeded limit".format(
+            check_job_failures))
+
+
+class LongPollWaitStrategy(JobWaitStrategy):
+    '''
+    Ask the server to hold each _check_jobs call for up to hold_time
+    seconds until one of the outstanding jobs finishes, and check again as
+    soon as it answers. If the server answers early with no job finished, it
+    does not hold requests, and the remaining jobs are left to fallback.
+    '''
+
+    batch_checks = True
+
+    def __init__(self, hold_time=30, fallback=None):
+        self.hold_time = hold_time
+        self.fallback = fallback or BackoffWaitStrategy()
+
+    def wait(self, client, service, job_ids):
+        states = {}
+        check_job_failures = 0
+        while check_job_failures < _CHECK_JOB_RETRYS:
+            pending = [job_id for job_id in job_ids if job_id not in states]
+            if not pending:
+                return [states[job_id] for job_id in job_ids]
+            start = time.time()
+            try:
+                checked = client._check_jobs(service, pending, self.hold_time,
+                                             batch=True)
+            except (ConnectionError, ProtocolError):
+                _traceback.print_exc()
+                check_job_failures += 1
+                continue
+            finished = dict((job_id, job_state) for job_id, job_state in checked.items()
+                            if _job_finished(job_state))
+            states.update(finished)
+            if not finished and time.time() - start < self.hold_time / 2.0:
+                return self.fallback.wait_pending(client, service, job_ids, states)
+        raise RuntimeError("_check_job failed {} times and exceeded limit".format(
+            check_job_failures))
+
+
+class _JobPoller(object):
+    '''
+    Waits on every outstanding job added by a BaseClient from one background
+    thread, checking the jobs of each service in each round, with one
+    _check_jobs call if the client's job_wait_strategy has batch_checks, and
+    resolves a future per job with its result. The thread exits when no
+    jobs are outstanding and is restarted by the next add.
+    '''
+
+    def __init__(self, client):
+        self._client = client
+        self._lock = _threading.Lock()
+        self._added = _threading.Event()
+        self._jobs = {}
+        self._thread = None
+
+    def add(self, service, job_id, future=None):
+        future = future or _Future()
+        with self._lock:
+            self._jobs.setdefault(service, {})[job_id] = future
+            self._added.set()
+            if self._thread is None:
+                self._thread = _threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return future
+
+    def _fail_all(self, error):
+        with self._lock:
+            futures = [f for jobs in self._jobs.values() for f in jobs.values()]
+            self._jobs = {}
+        for future in futures:
+            future.set_exception(error)
+
+    def _run(self):
+        backoff = self._client._backoff
+        delays = backoff.delays()
+        next_check = time.time() + next(delays)
+        check_job_failures = 0
+        while True:
+            if self._added.wait(max(next_check - time.time(), 0)):
+                # check a new job no later than the first backoff step
+                self._added.clear()
+                delays = backoff.delays()
+                next_check = min(next_check, time.time() + next(delays))
+                continue
+            with self._lock:
+                jobs = dict((service, list(futures))
+                            for service, futures in self._jobs.items())
+            try:
+                for service, job_ids in jobs.items():
+                    checked = self._client._check_jobs(
+                        service, job_ids,
+                        batch=self._client.job_wait_strategy.batch_checks)
+                    for job_id, job_state in checked.items():
+                        failed = isinstance(job_state, Exception)
+                        if failed or job_state['finished']:
+                            with self._lock:
+                                future = self._jobs[service].pop(job_id)
+                            if failed:
+                                future.set_exception(job_state)
+                            else:
+                                future.set_result(_job_result(job_state))
+                check_job_failures = 0
+            except (ConnectionError, ProtocolError):
+                _traceback.print_exc()
+                check_job_failures += 1
+                if check_job_failures >= _CHECK_JOB_RETRYS:
+                    self._fail_all(RuntimeError(
+                        "_check_job failed {} times and exceeded limit".format(
+                            check_job_failures)))
+            except Exception as e:
+                # failed jobs come back from _check_jobs, so this is a failure
+                # to reach the server or of the server itself
+                self._fail_all(e)
+            with self._lock:
+                self._jobs = dict((service, futures)
+                                  for service, futures in self._jobs.items() if futures)
+                if not self._jobs:
+                    self._thread = None
+                    return
+            next_check = time.time() + next(delays)
+
+
 class BaseClient(object):
     '''
     The KBase base client.
@@ -120,6 +381,21 @@ class BaseClient(object):
     lookup_url - set to true when contacting KBase dynamic services.
     async_job_check_time_ms - the wait time between checking job state for
         asynchronous jobs run with the run_job method.
+    pool_maxsize - the maximum number of kept-alive connections per host in
+        the client's connection pool. Default 10.
+    connect_retries - the number of times to retry a request that failed
+        to connect. Requests that reached the server are never retried.
+        Default 3.
+    retry_backoff_factor - the backoff factor in seconds between connect
+        retries. Default 0.5.
+    stream_requests - send request bodies with chunked transfer encoding
+        instead of building the whole JSON string first. Only for servers
+        that accept chunked requests. Default False.
+    job_wait_strategy - a JobWaitStrategy deciding how run_job and
+        wait_for_jobs wait for jobs. Default a BackoffWaitStrategy built
+        from the async_job_check settings, checking jobs with _check_job.
+        Jobs from submit_many are checked with _check_jobs when its
+        batch_checks is True.
     '''
     def __init__(
             self, url=None, timeout=30 * 60, user_id=None,
@@ -129,7 +405,12 @@ class BaseClient(object):
             lookup_url=False,
             async_job_check_time_ms=100,
             async_job_check_time_scale_percent=150,
-            async_job_check_max_time_ms=300000):
+            async_job_check_max_time_ms=300000,
+            pool_maxsize=_POOL_MAXSIZE,
+            connect_retries=_CONNECT_RETRIES,
+            retry_backoff_factor=_RETRY_BACKOFF_FACTOR,
+            stream_requests=False,
+            job_wait_strategy=None):
         if url is None:
             raise ValueError('A url is required')
         scheme, _, _, _, _, _ = _urlparse(url)
@@ -144,6 +425,18 @@ class BaseClient(object):
         self.async_job_check_time_scale_percent = (
             async_job_check_time_scale_percent)
         self.async_job_check_max_time = async_job_check_max_time_ms / 1000.0
+        self.stream_requests = stream_requests
+        self._backoff = BackoffWaitStrategy(
+            self.async_job_check_time, async_job_check_time_scale_percent,
+            self.async_job_check_max_time)
+        self.job_wait_strategy = job_wait_strategy or self._backoff
+        self._job_poller = _JobPoller(self)
+        # services whose server has no _check_jobs method
+        self._no_batch_check = set()
+        self._session = self._make_session(pool_maxsize, connect_retries,
+                                           retry_backoff_factor)
+        self._stats_lock = _threading.Lock()
+        self._request_count = 0
         # token overrides user_id and password
         if token is not None:
             self._headers['AUTHORIZATION'] = token
@@ -164,6 +457,39 @@ class BaseClient(object):
         if self.timeout < 1:
             raise ValueError('Timeout value must be at least 1 second')
 
+    def _make_session(self, pool_maxsize, connect_retries,
+                      retry_backoff_factor):
+        # requests that reached the server are not retried, since RPC calls
+        # are not guaranteed to be idempotent
+        retry = _Retry(total=connect_retries, connect=connect_retries,
+                       read=0, status=0, redirect=0,
+                       backoff_factor=retry_backoff_factor,
+                       raise_on_status=False)
+        adapter = _HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+        session = _requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def connection_stats(self):
+        '''
+        Return the number of requests this client has made, the number of
+        connections it opened for them and how many requests reused an open
+        connection.
+        '''
+        connections = 0
+        for adapter in set(self._session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+        with self._stats_lock:
+            requests = self._request_count
+        return {'requests': requests,
+                'connections': connections,
+                'reused': max(requests - connections, 0)}
+
     def _call(self, url, method, params, context=None):
         arg_hash = {'method': method,
                     'params': params,
@@ -175,14 +501,16 @@ class BaseClient(object):
                 raise ValueError('context is not type dict as required.')
             arg_hash['context'] = context
 
-        body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(url, data=body, headers=self._headers,
-                             timeout=self.timeout,
-                             verify=not self.trust_all_ssl_certificates)
+        body = _encode_body(arg_hash, self.stream_requests)
+        with self._stats_lock:
+            self._request_count += 1
+        ret = self._session.post(url, data=body, headers=self._headers,
+                                 timeout=self.timeout,
+                                 verify=not self.trust_all_ssl_certificates)
         ret.encoding = 'utf-8'
         if ret.status_code == 500:
             if ret.headers.get(_CT) == _AJ:
-                err = ret.json()
+                err = _decode_body(ret.content)
                 if 'error' in err:
                     raise ServerError(**err['error'])
                 else:
@@ -191,7 +519,7 @@ class BaseClient(object):
                 raise ServerError('Unknown', 0, ret.text)
         if not ret.ok:
             ret.raise_for_status()
-        resp = ret.json()
+        resp = _decode_body(ret.content)
         if 'result' not in resp:
             raise ServerError('Unknown', 0, 'An unknown server error occurred')
         if not resp['result']:
@@ -219,6 +547,40 @@ class BaseClient(object):
     def _check_job(self, service, job_id):
         return self._call(self.url, service + '._check_job', [job_id])
 
+    def _check_jobs(self, service, job_ids, wait_time=None, batch=False):
+        '''
+        Return a dict of job id to job state for job_ids, from one _check_job
+        call per job. A job whose _check_job call raises a ServerError, as it
+        does for a failed job, maps to that error.
+        With batch, the states come from one _check_jobs call instead, when
+        the server has that method and answers it with a state for every
+        job; otherwise this check falls back to _check_job. wait_time, in
+        seconds, lets a server that supports long polling hold the
+        _check_jobs call until a job finishes.
+        '''
+        if batch and service not in self._no_batch_check:
+            args = [job_ids]
+            if wait_time is not None:
+                args.append({'wait_ms': int(wait_time * 1000)})
+            try:
+                checked = self._call(self.url, service + '._check_jobs', args)
+            except ServerError as e:
+                if e.code == _METHOD_NOT_FOUND:
+                    self._no_batch_check.add(service)
+                checked = None
+            except _HTTPError:
+                checked = None
+            if (isinstance(checked, dict) and
+                    all(isinstance(checked.get(job_id), dict) for job_id in job_ids)):
+                return dict((job_id, checked[job_id]) for job_id in job_ids)
+        states = {}
+        for job_id in job_ids:
+            try:
+                states[job_id] = self._check_job(service, job_id)
+            except ServerError as e:
+                states[job_id] = e
+        return states
+
     def _submit_job(self, service_method, args, service_ver=None,
                     context=None):
         context = self._set_up_context(service_ver, context)
@@ -239,31 +601,77 @@ class BaseClient(object):
         '''
         mod, _ = service_method.split('.')
         job_id = self._submit_job(service_method, args, service_ver, context)
-        async_job_check_time = self.async_job_check_time
-        check_job_failures = 0
-        while check_job_failures < _CHECK_JOB_RETRYS:
-            time.sleep(async_job_check_time)
-            async_job_check_time = (async_job_check_time *
-                                    self.async_job_check_time_scale_percent /
-                                    100.0)
-            if async_job_check_time > self.async_job_check_max_time:
-                async_job_check_time = self.async_job_check_max_time
+        return self.wait_for_jobs(mod, [job_id])[0]
 
-            try:
-                job_state = self._check_job(mod, job_id)
-            except (ConnectionError, ProtocolError):
-                _traceback.print_exc()
-                check_job_failures += 1
-                continue
+    def wait_for_jobs(self, service, job_ids):
+        '''
+        Wait for jobs submitted with _submit_job and return their results,
+        in the same order as job_ids.
+        Required arguments:
+        service - the service the jobs were submitted to, e.g. myserv.
+        job_ids - a list of job ids.
+        '''
+        if not job_ids:
+            return []
+        return [_job_result(job_state) for job_state in
+                self.job_wait_strategy.wait(self, service, job_ids)]
 
-            if job_state['finished']:
-                if not job_state['result']:
+    def submit_many(self, service_method, args_list, service_ver=None,
+                    context=None, max_outstanding=_POOL_MAXSIZE):
+        '''
+        Run a SDK method once per entry of args_list and return a list of
+        concurrent.futures.Future for the results, in the same order.
+        At most max_outstanding jobs are submitted at a time; the next one
+        is submitted as soon as one finishes. All outstanding jobs of this
+        client are checked in rounds by one background thread, backing off
+        with the async_job_check settings.
+        Required arguments:
+        service_method - the service and method to run, e.g. myserv.mymeth.
+        args_list - a list of argument lists, one per job.
+        Optional arguments:
+        service_ver - the version of the service to run, e.g. a git hash
+            or dev/beta/release.
+        context - the rpc context dict.
+        max_outstanding - the most jobs to have submitted but unfinished.
+        '''
+        mod, _ = service_method.split('.')
+        futures = [_Future() for _ in args_list]
+        pending = iter(list(enumerate(args_list)))
+        pending_lock = _threading.Lock()
+
+        def submit_next(_=None):
+            while True:
+                with pending_lock:
+                    index, args = next(pending, (None, None))
+                if index is None:
                     return
-                if len(job_state['result']) == 1:
-                    return job_state['result'][0]
-                return job_state['result']
-        raise RuntimeError("_check_job failed {} times and exceeded limit".format(
-            check_job_failures))
+                try:
+                    job_id = self._submit_job(service_method, args, service_ver,
+                                              context)
+                except Exception as e:
+                    futures[index].set_exception(e)
+                    continue
+                futures[index].add_done_callback(submit_next)
+                self._job_poller.add(mod, job_id, futures[index])
+                return
+
+        for _ in range(min(max(int(max_outstanding), 1), len(futures))):
+            submit_next()
+        return futures
+
+    def gather(self, futures, timeout=None):
+        '''
+        Wait for futures from submit_many and return their results in the
+        same order, raising the first job's error if any job failed.
+        Optional arguments:
+        timeout - seconds to wait for all results before raising
+            concurrent.futures.TimeoutError.
+        '''
+        _, not_done = _wait_futures(futures, timeout)
+        if not_done:
+            raise _TimeoutError('{} of {} jobs did not finish in {} seconds'.format(
+                len(not_done), len(futures), timeout))
+        return [future.result() for future in futures]
 
     def call_method(self, service_method, args, service_ver=None,
                     context=None):
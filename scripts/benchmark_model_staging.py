@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from Snekmer.Utils.model_staging import stage_model_output, STAGING_MODES  # noqa: E402
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print("Usage: <program> [<model_output_dir>]")
+        print("Times each model output staging mode against <model_output_dir>,")
+        print("which defaults to data/model_output in this repository.")
+        sys.exit(1)
+    source_dir = sys.argv[1] if len(sys.argv) == 2 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'model_output')
+    for mode in STAGING_MODES:
+        with tempfile.TemporaryDirectory() as scratch:
+            start = time.time()
+            stage_model_output(source_dir, os.path.join(scratch, 'model_output'), mode)
+            print("{}: {:.3f}s".format(mode, time.time() - start))
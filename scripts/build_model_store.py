@@ -0,0 +1,17 @@
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from Snekmer.Utils.model_store import build_model_store  # noqa: E402
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: <program> <model_output_dir> <model_store_dir>")
+        print("Converts the pickled snekmer models in <model_output_dir> into")
+        print("memory-mappable .npy arrays and a manifest in <model_store_dir>.")
+        sys.exit(1)
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+    manifest = build_model_store(sys.argv[1], sys.argv[2])
+    print("Stored {} families in {}".format(len(manifest['families']), sys.argv[2]))
@@ -0,0 +1,59 @@
+import json
+import sys
+import threading
+import time
+
+import requests
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or len(sys.argv) > 4:
+        print("Usage: <program> <server_url> [<requests>] [<concurrency>]")
+        print("Sends <requests> Snekmer.status calls (default 1000) to a running")
+        print("Snekmer server from <concurrency> threads (default 10) and reports")
+        print("requests/sec and latency percentiles.")
+        sys.exit(1)
+    url = sys.argv[1]
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            body = json.dumps({'method': 'Snekmer.status', 'params': [],
+                               'version': '1.1', 'id': str(i)})
+            start = time.time()
+            try:
+                ret = session.post(url, data=body, timeout=60)
+                ok = ret.ok and 'result' in ret.json()
+            except (requests.RequestException, ValueError):
+                ok = False
+            elapsed = time.time() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors.append(i)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    latencies.sort()
+    print("{} requests from {} threads in {:.2f}s, {} errors".format(
+        total, concurrency, elapsed, len(errors)))
+    print("{:.1f} requests/sec".format(total / elapsed))
+    for percentile in (50, 90, 99):
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        print("p{}: {:.1f} ms".format(percentile, latencies[index] * 1000))
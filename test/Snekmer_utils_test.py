@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+import itertools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from installed_clients.baseclient import BaseClient
+from installed_clients.GenomeAnnotationAPIClient import GenomeAnnotationAPI
+from installed_clients.GenomeFileUtilClient import GenomeFileUtil
+from installed_clients.WorkspaceClient import Workspace
+from Snekmer.Utils.annotation import (build_hit_index, hits_for_genome, annotate_features,
+                                      AnnotationCounter)
+from Snekmer.Utils.auth_cache import AuthCache
+from Snekmer.Utils.command import run_command
+from Snekmer.Utils.fasta import write_protein_fasta
+from Snekmer.Utils.genome_cache import GenomeCache
+from Snekmer.Utils.genome_fetch import fetch_genome_projections, GENOME_READ_PATHS
+from Snekmer.Utils.genome_save import save_annotated_genomes
+from Snekmer.Utils.genome_spool import GenomeSpool
+from Snekmer.Utils.model_staging import stage_model_output
+from Snekmer.Utils.model_store import build_model_store, ModelStore
+from Snekmer.Utils.search_results import aggregate_search_results
+
+TEST_MODEL_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                                 'small_test_model_output')
+
+
+class FakeJobClient(BaseClient):
+    '''A BaseClient that runs each submitted job with handler instead of over HTTP.'''
+
+    def __init__(self, handler):
+        super(FakeJobClient, self).__init__('http://localhost', token='token',
+                                            ignore_authrc=True, async_job_check_time_ms=1,
+                                            async_job_check_max_time_ms=10)
+        self.handler = handler
+        self.job_ids = itertools.count()
+        self.jobs = {}
+
+    def _submit_job(self, service_method, args, service_ver=None, context=None):
+        job_id = str(next(self.job_ids))
+        self.jobs[job_id] = self.handler(*args)
+        return job_id
+
+    def _check_job(self, service, job_id):
+        return {'finished': 1, 'result': [self.jobs[job_id]]}
+
+    def _check_jobs(self, service, job_ids, wait_time=None, batch=False):
+        return dict((job_id, self._check_job(service, job_id)) for job_id in job_ids)
+
+    def call_method(self, service_method, args, service_ver=None, context=None):
+        return self.handler(*args)
+
+
+def fake_ws_client(requests=None):
+    def get_objects2(params):
+        time.sleep(random.random() / 100)
+        if requests is not None:
+            requests.append(params)
+        return {'data': [{'data': {'id': params['objects'][0]['ref']}}]}
+    ws_client = Workspace('http://localhost')
+    ws_client._client = FakeJobClient(get_objects2)
+    return ws_client
+
+
+def fake_gfu(saved):
+    def save_one_genome(params):
+        time.sleep(random.random() / 100)
+        saved.append((params['name'], params['data']))
+        objid = int(params['name'].split('_')[1])
+        return {'info': [objid, params['name'], 'KBaseGenomes.Genome', '', 1, 'user', 7]}
+    gfu = GenomeFileUtil('http://localhost')
+    gfu._client = FakeJobClient(save_one_genome)
+    return gfu
+
+
+class SnekmerUtilsTest(unittest.TestCase):
+
+    def test_auth_cache_coalesces_lookups(self):
+        calls = []
+
+        def validate(token):
+            calls.append(token)
+            time.sleep(0.2)
+            return 'user1'
+        cache = AuthCache(validate)
+        sources = []
+        threads = [threading.Thread(target=lambda: sources.append(cache.lookup('token1')[1]))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, ['token1'])
+        self.assertEqual(sorted(sources), ['auth service'] + ['coalesced'] * 4)
+        self.assertEqual(cache.lookup('token1'), ('user1', 'cache'))
+
+    def test_auth_cache_refreshes_in_background(self):
+        users = iter(['user1', 'user1'])
+        calls = []
+
+        def validate(token):
+            calls.append(token)
+            return next(users)
+        cache = AuthCache(validate, ttl=10, refresh_margin=10)
+        self.assertEqual(cache.lookup('token1'), ('user1', 'auth service'))
+        self.assertEqual(cache.lookup('token1'), ('user1', 'cache'))
+        cache._refresher.shutdown(wait=True)
+        self.assertEqual(len(calls), 2)
+
+    def test_auth_cache_keeps_tokens_when_refresh_fails(self):
+        calls = []
+
+        def validate(token):
+            calls.append(token)
+            if len(calls) > 1:
+                raise ConnectionError('auth service unavailable')
+            return 'user1'
+        cache = AuthCache(validate, ttl=10, refresh_margin=10)
+        self.assertEqual(cache.lookup('token1'), ('user1', 'auth service'))
+        self.assertEqual(cache.lookup('token1'), ('user1', 'cache'))
+        cache._refresher.shutdown(wait=True)
+        self.assertEqual(len(calls), 2)
+        cache._refresher = None
+        self.assertEqual(cache.lookup('token1'), ('user1', 'cache'))
+
+    def test_auth_cache_drops_rejected_tokens(self):
+        def validate(token):
+            raise ValueError('Invalid token')
+        cache = AuthCache(validate)
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                cache.lookup('token1')
+
+    def test_fetch_genome_projections_keeps_order(self):
+        requests = []
+        refs = ['1/{}/1'.format(i) for i in range(20)]
+        genomes = fetch_genome_projections(fake_ws_client(requests), refs, max_workers=4)
+        self.assertEqual([g['data']['id'] for g in genomes], refs)
+        self.assertEqual(requests[0]['objects'][0]['included'], GENOME_READ_PATHS)
+
+    def test_fetch_genome_projections_on_fetched(self):
+        refs = ['1/{}/1'.format(i) for i in range(5)]
+        ids = fetch_genome_projections(fake_ws_client(), refs, max_workers=2,
+                                       on_fetched=lambda index, genome: (index,
+                                                                         genome['data']['id']))
+        self.assertEqual(ids, list(enumerate(refs)))
+
+    def test_fetch_genome_projections_bounds_held_genomes(self):
+        held = []
+        peak = []
+        lock = threading.Lock()
+
+        def get_objects2(params):
+            ref = params['objects'][0]['ref']
+            with lock:
+                held.append(ref)
+                peak.append(len(held))
+            return {'data': [{'data': {'id': ref}}]}
+
+        def on_fetched(index, genome):
+            time.sleep(0.01)
+            with lock:
+                held.remove(genome['data']['id'])
+            return index
+        ws_client = Workspace('http://localhost')
+        ws_client._client = FakeJobClient(get_objects2)
+        refs = ['1/{}/1'.format(i) for i in range(40)]
+        self.assertEqual(fetch_genome_projections(ws_client, refs, max_workers=2,
+                                                  on_fetched=on_fetched), list(range(40)))
+        self.assertLessEqual(max(peak), 2)
+
+    def test_fetch_genome_projections_empty(self):
+        self.assertEqual(fetch_genome_projections(fake_ws_client(), []), [])
+
+    def test_fetch_genome_projections_cache(self):
+        refs = ['1/{}/1'.format(i) for i in range(3)] + ['1/3']
+        with tempfile.TemporaryDirectory() as scratch:
+            cache = GenomeCache(scratch)
+            fetch_genome_projections(fake_ws_client(), refs, cache=cache)
+            requests = []
+            genomes = fetch_genome_projections(fake_ws_client(requests), refs, cache=cache)
+            self.assertEqual([g['data']['id'] for g in genomes], refs)
+            # only the unversioned ref is fetched again
+            self.assertEqual([r['objects'][0]['ref'] for r in requests], ['1/3'])
+            self.assertEqual((cache.hits, cache.misses), (3, 5))
+
+    def test_genome_cache_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            cache = GenomeCache(scratch, max_mb=0.015)
+            genome = {'data': {'id': 'g', 'seq': ''.join(random.choice('ACDEFGHIKLMNPQRSTVWY')
+                                                         for _ in range(20000))}}
+            cache.put('1/1/1', genome)
+            os.utime(cache._path('1/1/1'), (1, 1))
+            cache.put('1/2/1', genome)
+            self.assertIsNone(cache.get('1/1/1'))
+            self.assertEqual(cache.get('1/2/1'), genome)
+            self.assertEqual(cache.evictions, 1)
+
+    def test_genome_spool(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            spool = GenomeSpool(os.path.join(scratch, 'spool'))
+            genome = {'data': {'id': 'g1', 'scientific_name': 'E. coli',
+                               'features': [{'id': 'b0001', 'functions': [],
+                                             'protein_translation': 'MKR'}],
+                               'cdss': [{'id': 'b0001_CDS_1'}]}}
+            self.assertEqual(spool.put(3, genome), {'id': 'g1', 'scientific_name': 'E. coli'})
+            self.assertEqual(spool.load(3)['data']['features'], [{'id': 'b0001', 'functions': []}])
+
+    def test_annotate_features_single_pass(self):
+        hits = pd.DataFrame({'filename': ['g1.E_coli.faa', 'g1.E_coli.faa',
+                                          'g2.D_vulgaris.faa'],
+                             'sequence_id': ['b0001', 'b0001', 'b0001'],
+                             'model': ['nirS.model', 'amoA.model', 'nrfA.model']})
+        index = build_hit_index(hits)
+        features = [{'id': 'b0001', 'functions': ['f1'], 'function': 'f1'},
+                    {'id': 'b0002', 'functions': []}]
+        added = annotate_features(features, hits_for_genome(index, 'g1.E_coli.faa'))
+        self.assertEqual(added, 2)
+        self.assertEqual(features[0]['functions'], ['f1', 'nirS.model', 'amoA.model'])
+        self.assertEqual(features[0]['function'], 'f1, nirS.model, amoA.model')
+        self.assertEqual(features[1]['functions'], [])
+
+    def test_hits_for_genome_matches_exact_file(self):
+        hits = pd.DataFrame({'filename': ['g1.Escherichia_coli.faa',
+                                          'g2.Escherichia_coli_K-12.faa'],
+                             'sequence_id': ['b0001', 'b0002'],
+                             'model': ['nirS.model', 'amoA.model']})
+        index = build_hit_index(hits)
+        self.assertEqual(hits_for_genome(index, 'g1.Escherichia_coli.faa'),
+                         {'b0001': ['nirS.model']})
+        self.assertEqual(hits_for_genome(index, 'g3.Escherichia_coli.faa'), {})
+        self.assertEqual(len(index), 2)
+
+    def test_annotation_counter_totals(self):
+        counter = AnnotationCounter()
+        features = [{'id': 'a', 'functions': []}, {'id': 'b', 'functions': []},
+                    {'id': 'c'}]
+        delta = counter.compute_delta('g1', features, {'a': ['nirS.model'], 'c': ['amoA.model']})
+        self.assertEqual(delta, {'a': ['nirS.model']})
+        self.assertEqual(features[0]['functions'], [])
+        counter.compute_delta('g2', [{'id': 'd', 'function': ''}], {})
+        self.assertEqual(counter.genomes, 2)
+        self.assertEqual(counter.features_scanned, 4)
+        self.assertEqual(counter.annotations_added, 1)
+
+    def test_stage_model_output_shared(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            dirs = stage_model_output(TEST_MODEL_OUTPUT, os.path.join(scratch, 'model_output'))
+            self.assertTrue(dirs['model_dir'].startswith(TEST_MODEL_OUTPUT))
+            self.assertTrue(dirs['score_dir'].startswith(TEST_MODEL_OUTPUT))
+            self.assertTrue(dirs['basis_dir'].startswith(scratch))
+            self.assertEqual(sorted(os.listdir(dirs['basis_dir'])), ['cNorB.kmers', 'nirS.kmers'])
+            self.assertTrue(os.path.islink(os.path.join(dirs['basis_dir'], 'nirS.kmers')))
+
+    def test_stage_model_output_families(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            dirs = stage_model_output(TEST_MODEL_OUTPUT, os.path.join(scratch, 'model_output'),
+                                      families=['nirS'])
+            self.assertEqual(os.listdir(dirs['model_dir']), ['nirS.model'])
+            self.assertEqual(os.listdir(dirs['basis_dir']), ['nirS.kmers'])
+            self.assertEqual(os.listdir(dirs['score_dir']), ['nirS.scorer'])
+            with self.assertRaises(ValueError):
+                stage_model_output(TEST_MODEL_OUTPUT, os.path.join(scratch, 'unknown'),
+                                   families=['amoA'])
+
+    def test_build_model_store(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            build_model_store(TEST_MODEL_OUTPUT, scratch)
+            store = ModelStore(scratch)
+            self.assertEqual(store.families, ['cNorB', 'nirS'])
+            model = store.load('nirS')
+            self.assertIsInstance(model.weights, np.memmap)
+            self.assertEqual(model.basis.shape, model.weights.shape)
+            self.assertEqual(len(model.basis[0]), model.k)
+            self.assertEqual(model.classes.tolist(), [0, 1])
+            with self.assertRaises(ValueError):
+                store.load('amoA')
+
+    def test_run_command_streams_large_output(self):
+        # more output than a pipe buffer holds
+        script = 'import sys\nfor i in range(20000): print("x" * 80)\nsys.exit(0)'
+        self.assertGreaterEqual(run_command([sys.executable, '-c', script]), 0)
+
+    def test_run_command_fails_fast(self):
+        script = 'import sys\nprint("boom")\nsys.exit(3)'
+        with self.assertRaisesRegex(RuntimeError, 'return code 3'):
+            run_command([sys.executable, '-c', script])
+
+    def test_aggregate_search_results(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            result_directory = os.path.join(scratch, 'search')
+            for family, in_family in (('nirS', [True, False]), ('amoA', [False, False])):
+                os.makedirs(os.path.join(result_directory, family))
+                pd.DataFrame({'sequence_id': ['b0001', 'b0002'],
+                              'score': [0.9, 0.1],
+                              'in_family': in_family,
+                              'probability': [0.9, 0.1],
+                              'filename': 'g1.E_coli.faa',
+                              'model': family + '.model'}).to_csv(
+                    os.path.join(result_directory, family, 'g1.E_coli.csv'), index=False)
+            zip_path = os.path.join(scratch, 'results.zip')
+            with zipfile.ZipFile(zip_path, 'w') as zip_file:
+                results = aggregate_search_results(result_directory, zip_file)
+            with zipfile.ZipFile(zip_path) as zip_file:
+                self.assertEqual(sorted(zip_file.namelist()),
+                                 ['amoA/g1.E_coli.csv', 'nirS/g1.E_coli.csv'])
+        self.assertEqual(results.total_rows, 4)
+        self.assertEqual(results.unique_sequences, 2)
+        self.assertEqual(results.in_family_frame()['Count'].to_dict(), {False: 3, True: 1})
+        self.assertEqual(hits_for_genome(results.hit_index, 'g1.E_coli.faa'),
+                         {'b0001': ['nirS.model']})
+
+    def test_save_annotated_genomes(self):
+        saved = []
+
+        def get_genome_v1(params):
+            ref = params['genomes'][0]['ref']
+            return {'genomes': [{'data': {'id': ref,
+                                          'features': [{'id': 'b0001', 'functions': []}]}}]}
+        genome_api = GenomeAnnotationAPI('http://localhost')
+        genome_api._client = FakeJobClient(get_genome_v1)
+        gfu = fake_gfu(saved)
+        patches = [('1/{}/1'.format(i), 'genome_{}'.format(i), {'b0001': ['nirS.model']})
+                   for i in range(6)]
+        refs = save_annotated_genomes(genome_api, gfu, 'ws', patches, max_workers=2)
+        self.assertEqual(refs, ['7/{}/1'.format(i) for i in range(6)])
+        self.assertEqual(sorted(name for name, _ in saved), sorted(p[1] for p in patches))
+        self.assertTrue(all(data['features'][0]['functions'] == ['nirS.model']
+                            for _, data in saved))
+
+    def test_write_protein_fasta(self):
+        genome = {'id': 'GCF_000021385.1',
+                  'features': [{'id': 'b0001', 'protein_translation': 'MKRIST'},
+                               {'id': 'b0002', 'protein_translation': ''},
+                               {'id': 'b0003', 'protein_translation': 'MAVE'}]}
+        with tempfile.TemporaryDirectory() as scratch:
+            path = write_protein_fasta(genome, 'E._coli', scratch)
+            self.assertEqual(os.path.basename(path), 'GCF_000021385_1.E._coli.faa')
+            with open(path) as fasta:
+                self.assertEqual(fasta.read(), '>b0001\nMKRIST\n>b0003\nMAVE\n')
+
+    def test_write_protein_fasta_from_cdss(self):
+        genome = {'id': 'g1',
+                  'features': [{'id': 'gene_1'}],
+                  'cdss': [{'id': 'gene_1_CDS_1', 'parent_gene': 'gene_1',
+                            'protein_translation': 'MKR'}]}
+        with tempfile.TemporaryDirectory() as scratch:
+            with open(write_protein_fasta(genome, 'name', scratch)) as fasta:
+                self.assertEqual(fasta.read(), '>gene_1\nMKR\n')
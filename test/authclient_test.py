@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import unittest
+from unittest import mock
+
+from installed_clients import authclient
+from installed_clients.authclient import TokenCache
+
+
+class TokenCacheTest(unittest.TestCase):
+
+    def test_get_user(self):
+        cache = TokenCache()
+        self.assertIsNone(cache.get_user('token1'))
+        cache.add_valid_token('token1', 'user1')
+        self.assertEqual(cache.get_user('token1'), 'user1')
+        self.assertEqual(cache.stats(), {'size': 1, 'hits': 1, 'misses': 1,
+                                         'evictions': 0, 'expirations': 0})
+
+    def test_evicts_least_recently_used(self):
+        cache = TokenCache(maxsize=2)
+        cache.add_valid_token('token1', 'user1')
+        cache.add_valid_token('token2', 'user2')
+        cache.get_user('token1')
+        cache.add_valid_token('token3', 'user3')
+        self.assertEqual(cache.get_user('token1'), 'user1')
+        self.assertIsNone(cache.get_user('token2'))
+        self.assertEqual(cache.get_user('token3'), 'user3')
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expires_lazily(self):
+        cache = TokenCache(ttl=60)
+        with mock.patch.object(authclient._time, 'time', return_value=1000):
+            cache.add_valid_token('token1', 'user1')
+        with mock.patch.object(authclient._time, 'time', return_value=1061):
+            self.assertIsNone(cache.get_user('token1'))
+        self.assertEqual(cache.stats()['size'], 0)
+        self.assertEqual(cache.stats()['expirations'], 1)
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import itertools
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import TimeoutError as futures_TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from installed_clients import baseclient
+from installed_clients.asyncbaseclient import AsyncBaseClient
+from installed_clients.baseclient import BaseClient, BackoffWaitStrategy, LongPollWaitStrategy
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # keep-alive, like the callback server
+    protocol_version = 'HTTP/1.1'
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding') != 'chunked':
+            return self.rfile.read(int(self.headers['Content-Length']))
+        body = b''
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            chunk = self.rfile.read(size)
+            self.rfile.readline()
+            if not size:
+                return body
+            body += chunk
+
+    def do_POST(self):
+        self.server.chunked = self.headers.get('Transfer-Encoding') == 'chunked'
+        req = json.loads(self.read_body())
+        resp = self.server.dispatch(req)
+        if isinstance(resp, int):
+            # a bare HTTP status, as from a proxy in front of the server
+            self.send_response(resp)
+            self.send_header('content-length', '0')
+            self.end_headers()
+            return
+        body = json.dumps(resp).encode('utf-8')
+        self.send_response(500 if 'error' in resp else 200)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    '''A local JSON-RPC 1.1 server that echoes the params of every call.'''
+
+    daemon_threads = True
+
+    def __init__(self):
+        super(StandInServer, self).__init__(('localhost', 0), StandInHandler)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://localhost:{}'.format(self.server_address[1])
+
+    def dispatch(self, req):
+        return {'version': '1.1', 'id': req['id'], 'result': [req['params']]}
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StandInJobServer(StandInServer):
+    '''
+    Runs Echo.echo as an SDK job that finishes after the number of seconds
+    given as its second argument, or fails if that is negative. batch adds
+    Echo._check_jobs, and hold makes it hold each call until a job finishes
+    or wait_ms passes. Each entry of batch_replies, an HTTP status, error
+    code or result, replaces the answer to the next Echo._check_jobs call.
+    '''
+
+    def __init__(self, batch=True, hold=False):
+        super(StandInJobServer, self).__init__()
+        self.batch = batch
+        self.hold = hold
+        self.ids = itertools.count()
+        self.jobs = {}
+        self.failed = set()
+        self.batch_replies = []
+        self.calls = []
+
+    def job_state(self, job_id):
+        result, finish_time = self.jobs[job_id]
+        if time.time() < finish_time:
+            return {'finished': 0}
+        return {'finished': 1, 'result': [result]}
+
+    def dispatch(self, req):
+        method = req['method']
+        self.calls.append(method)
+        if method == 'Echo._echo_submit':
+            job_id = str(next(self.ids))
+            self.jobs[job_id] = (req['params'][0], time.time() + req['params'][1])
+            if req['params'][1] < 0:
+                self.failed.add(job_id)
+            result = job_id
+        elif method == 'Echo._check_job':
+            job_id = req['params'][0]
+            if job_id in self.failed:
+                return {'version': '1.1', 'id': req['id'],
+                        'error': {'name': 'JSONRPCError', 'code': -32000,
+                                  'message': 'job {} failed'.format(job_id)}}
+            result = self.job_state(job_id)
+        elif method == 'Echo._check_jobs' and self.batch_replies:
+            reply = self.batch_replies.pop(0)
+            if 'status' in reply:
+                return reply['status']
+            if 'code' in reply:
+                return {'version': '1.1', 'id': req['id'],
+                        'error': {'name': 'JSONRPCError', 'code': reply['code'],
+                                  'message': 'Server error'}}
+            result = reply['result']
+        elif method == 'Echo._check_jobs' and self.batch:
+            job_ids = req['params'][0]
+            if self.hold and len(req['params']) > 1:
+                deadline = time.time() + req['params'][1]['wait_ms'] / 1000.0
+                while (time.time() < deadline and
+                       not any(self.job_state(j)['finished'] for j in job_ids)):
+                    time.sleep(0.01)
+            result = dict((job_id, self.job_state(job_id)) for job_id in job_ids)
+        else:
+            return {'version': '1.1', 'id': req['id'],
+                    'error': {'name': 'JSONRPCError', 'code': -32601,
+                              'message': 'Method not found'}}
+        return {'version': '1.1', 'id': req['id'], 'result': [result]}
+
+
+class JobWaitTest(unittest.TestCase):
+
+    def run_jobs(self, server, strategy, durations):
+        client = BaseClient(server.url, token='token', ignore_authrc=True,
+                            job_wait_strategy=strategy)
+        job_ids = [client._submit_job('Echo.echo', [i, duration])
+                   for i, duration in enumerate(durations)]
+        return client.wait_for_jobs('Echo', job_ids)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_run_job(self):
+        self.server = StandInJobServer()
+        client = BaseClient(self.server.url, token='token', ignore_authrc=True,
+                            async_job_check_time_ms=10)
+        self.assertEqual(client.run_job('Echo.echo', ['x', 0.05]), 'x')
+
+    def test_wait_for_jobs_checks_one_job_at_a_time_by_default(self):
+        self.server = StandInJobServer()
+        results = self.run_jobs(self.server, BackoffWaitStrategy(0.01, max_time=0.05),
+                                [0.1, 0])
+        self.assertEqual(results, [0, 1])
+        self.assertNotIn('Echo._check_jobs', self.server.calls)
+
+    def test_wait_for_jobs_checks_in_batches(self):
+        self.server = StandInJobServer()
+        results = self.run_jobs(self.server,
+                                BackoffWaitStrategy(0.01, max_time=0.05, batch_checks=True),
+                                [0.2, 0, 0.1, 0.05])
+        self.assertEqual(results, [0, 1, 2, 3])
+        self.assertNotIn('Echo._check_job', self.server.calls)
+
+    def test_wait_for_jobs_without_batch_checks(self):
+        self.server = StandInJobServer(batch=False)
+        results = self.run_jobs(self.server,
+                                BackoffWaitStrategy(0.01, max_time=0.05, batch_checks=True),
+                                [0.1, 0])
+        self.assertEqual(results, [0, 1])
+        # the missing batch method is only tried once
+        self.assertEqual(self.server.calls.count('Echo._check_jobs'), 1)
+
+    def test_batch_checks_fall_back_for_one_round(self):
+        self.server = StandInJobServer()
+        # a server error, a proxy error and a reply missing a job
+        self.server.batch_replies = [{'code': -32000}, {'status': 502},
+                                     {'result': {'0': {'finished': 0}}}]
+        results = self.run_jobs(self.server,
+                                BackoffWaitStrategy(0.01, max_time=0.05, batch_checks=True),
+                                [1, 1])
+        self.assertEqual(results, [0, 1])
+        self.assertIn('Echo._check_job', self.server.calls)
+        # batch checks are used again once the server answers them
+        self.assertGreater(self.server.calls.count('Echo._check_jobs'), 3)
+
+    def test_job_wait_strategy_is_abstract(self):
+        self.server = StandInServer()
+        with self.assertRaises(TypeError):
+            baseclient.JobWaitStrategy()
+
+    def test_submit_many(self):
+        self.server = StandInJobServer()
+        client = BaseClient(self.server.url, token='token', ignore_authrc=True,
+                            async_job_check_time_ms=10, async_job_check_max_time_ms=50)
+        durations = [0.2, 0, 0.1, 0.05, 0, 0.15]
+        futures = client.submit_many('Echo.echo', [[i, d] for i, d in enumerate(durations)],
+                                     max_outstanding=2)
+        self.assertEqual(client.gather(futures, timeout=10), list(range(len(durations))))
+        self.assertEqual(self.server.calls.count('Echo._echo_submit'), len(durations))
+        self.assertNotIn('Echo._check_jobs', self.server.calls)
+
+    def test_submit_many_checks_in_batches(self):
+        self.server = StandInJobServer()
+        client = BaseClient(self.server.url, token='token', ignore_authrc=True,
+                            async_job_check_time_ms=10, async_job_check_max_time_ms=50,
+                            job_wait_strategy=BackoffWaitStrategy(batch_checks=True))
+        futures = client.submit_many('Echo.echo', [[i, 0.1] for i in range(4)])
+        self.assertEqual(client.gather(futures, timeout=10), [0, 1, 2, 3])
+        self.assertNotIn('Echo._check_job', self.server.calls)
+
+    def test_submit_many_fails_only_the_failed_job(self):
+        self.server = StandInJobServer(batch=False)
+        client = BaseClient(self.server.url, token='token', ignore_authrc=True,
+                            async_job_check_time_ms=10, async_job_check_max_time_ms=50)
+        futures = client.submit_many('Echo.echo', [[0, -1], [1, 0.1], [2, 0.2], [3, 0]])
+        with self.assertRaisesRegex(baseclient.ServerError, 'job 0 failed'):
+            client.gather(futures, timeout=10)
+        self.assertEqual([f.result(timeout=10) for f in futures[1:]], [1, 2, 3])
+        with self.assertRaisesRegex(baseclient.ServerError, 'job 4 failed'):
+            self.run_jobs(self.server, BackoffWaitStrategy(0.01), [-1, 0])
+
+    def test_submit_many_caps_outstanding_jobs(self):
+        self.server = StandInJobServer()
+        client = BaseClient(self.server.url, token='token', ignore_authrc=True,
+                            async_job_check_time_ms=10)
+        futures = client.submit_many('Echo.echo', [[i, 0.3] for i in range(4)],
+                                     max_outstanding=2)
+        self.assertEqual(len(self.server.jobs), 2)
+        with self.assertRaises(futures_TimeoutError):
+            client.gather(futures, timeout=0.1)
+        self.assertEqual(client.gather(futures, timeout=10), [0, 1, 2, 3])
+
+    def test_long_poll(self):
+        self.server = StandInJobServer(hold=True)
+        start = time.time()
+        results = self.run_jobs(self.server, LongPollWaitStrategy(hold_time=5),
+                                [0.3, 0.5])
+        self.assertEqual(results, [0, 1])
+        self.assertLess(time.time() - start, 2)
+        self.assertLessEqual(self.server.calls.count('Echo._check_jobs'), 3)
+
+    def test_long_poll_falls_back_without_hold(self):
+        self.server = StandInJobServer()
+        results = self.run_jobs(self.server,
+                                LongPollWaitStrategy(5, BackoffWaitStrategy(0.01, max_time=0.05)),
+                                [0.1, 0])
+        self.assertEqual(results, [0, 1])
+
+
+class BaseClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer()
+        self.client = BaseClient(self.server.url, token='token', ignore_authrc=True)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_call_method_reuses_connection(self):
+        for i in range(5):
+            self.assertEqual(self.client.call_method('Echo.echo', [i]), [i])
+        stats = self.client.connection_stats()
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['reused'], 4)
+
+    def test_call_method_encodes_sets(self):
+        self.assertEqual(self.client.call_method('Echo.echo', [{'a': {1}}]), [{'a': [1]}])
+
+    def test_call_method_streams_request_body(self):
+        client = BaseClient(self.server.url, token='token', ignore_authrc=True,
+                            stream_requests=True)
+        params = [{'features': [{'id': str(i), 'function': 'x' * 100}
+                                for i in range(2000)]}]
+        self.assertEqual(client.call_method('Echo.echo', params), params)
+        self.assertTrue(self.server.chunked)
+
+    def test_encode_body_non_finite_floats(self):
+        arg_hash = {'a': float('nan'), 'b': float('inf'), 'c': float('-inf')}
+        self.assertEqual(baseclient._encode_body(arg_hash),
+                         '{"a": NaN, "b": Infinity, "c": -Infinity}')
+        self.assertEqual(b''.join(baseclient._encode_body(arg_hash, stream=True)),
+                         b'{"a": NaN, "b": Infinity, "c": -Infinity}')
+        self.assertEqual(self.client.call_method('Echo.echo', [float('inf')]), [float('inf')])
+
+    def test_call_method_decodes_big_integers(self):
+        big = 123456789012345678901234567890
+        self.assertEqual(self.client.call_method('Echo.echo', [big, -big]), [big, -big])
+        self.assertEqual(baseclient._decode_body(b'[-9999999999999999999]'),
+                         [-9999999999999999999])
+
+    def test_decode_body_non_finite_floats(self):
+        values = baseclient._decode_body(b'{"result": [[NaN, Infinity, -Infinity, 1.5]]}')
+        self.assertNotEqual(values['result'][0][0], values['result'][0][0])
+        self.assertEqual(values['result'][0][1:], [float('inf'), float('-inf'), 1.5])
+
+    def test_async_call_method(self):
+        async_client = AsyncBaseClient(self.client)
+
+        async def call_all():
+            return await asyncio.gather(*[async_client.call_method('Echo.echo', [i])
+                                          for i in range(10)])
+        self.assertEqual(asyncio.run(call_all()), [[i] for i in range(10)])